@@ -0,0 +1,46 @@
+import asyncio
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from swarm_flow.swarm import Swarm, Agent
+from mock_openai_server import MockOpenAIServer
+
+concurrency_levels = [10, 100, 500]
+server_latency = 0.2  # Simulated LLM latency in seconds
+
+
+async def run_threads(swarm, agent, num_calls):
+    """The previous path: the sync client wrapped in asyncio.to_thread"""
+    messages = [{"role": "user", "content": "Hello"}]
+    await asyncio.gather(*[
+        asyncio.to_thread(swarm.run, agent, messages) for _ in range(num_calls)
+    ])
+
+
+async def run_native(swarm, agent, num_calls):
+    """The native asyncio path"""
+    messages = [{"role": "user", "content": "Hello"}]
+    await asyncio.gather(*[swarm.arun(agent, messages) for _ in range(num_calls)])
+
+
+def bench(name, func, swarm, agent, num_calls, server):
+    server.max_in_flight = 0
+    start = time.perf_counter()
+    asyncio.run(func(swarm, agent, num_calls))
+    elapsed = time.perf_counter() - start
+    print(f"{name:>8} {num_calls:>5} calls: {elapsed:8.2f} s, {num_calls / elapsed:8.1f} calls/s, "
+          f"max in-flight {server.max_in_flight}")
+
+
+if __name__ == "__main__":
+    with MockOpenAIServer(latency=server_latency) as server:
+        agent = Agent(name="Bench", model="mock")
+        for num_calls in concurrency_levels:
+            # The clients are shared by the process: the sync pool stays warm across levels,
+            # the async client belongs to the event loop of each bench() and starts with an empty pool
+            swarm = Swarm(base_url=server.base_url, api_key="mock")
+            bench("threads", run_threads, swarm, agent, num_calls, server)
+            bench("async", run_native, swarm, agent, num_calls, server)
@@ -0,0 +1,77 @@
+import asyncio
+import copy
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from openai.types.chat import ChatCompletion
+
+from swarm_flow.swarm import Swarm, Agent
+
+context_size = 1024 * 1024  # Bytes of text held by the context variables
+history_turns = 200
+num_calls = 50
+
+
+class InstantClient:
+    """Async OpenAI client answering immediately, so that only the work of Swarm is measured"""
+
+    def __init__(self):
+        self.chat = self
+        self.completions = self
+
+    async def create(self, **kwargs):
+        return ChatCompletion.model_validate({
+            "id": "chatcmpl-bench",
+            "object": "chat.completion",
+            "created": 0,
+            "model": kwargs["model"],
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": "ok"}}],
+        })
+
+
+def build_context():
+    """Articles, for_each outputs and a conversation list, as held by a long workflow session"""
+    article = "lorem ipsum dolor sit amet " * (context_size // 2 // 27)
+    items = [f"Question {i}?\nAnswer: " + "consectetur adipiscing elit " * 18 for i in range(context_size // 2 // 512)]
+    return {"article": article, "qa_list": items, "conversation": [{"speaker": "A", "speech": s} for s in items[:100]]}
+
+
+def build_history():
+    history = []
+    for i in range(history_turns):
+        history.append({"role": "user", "content": f"Question {i}: " + "sed do eiusmod tempor " * 20})
+        history.append({"role": "assistant", "content": f"Answer {i}: " + "incididunt ut labore et dolore " * 30})
+    return history
+
+
+async def run_calls(swarm, agent, messages, context_variables, deepcopy):
+    for _ in range(num_calls):
+        if deepcopy:
+            # The copies previously made by every call
+            copy.deepcopy(context_variables)
+            copy.deepcopy(messages)
+        await swarm.arun(agent, messages, context_variables)
+
+
+def bench(name, swarm, agent, messages, context_variables, deepcopy):
+    tracemalloc.start()
+    start = time.perf_counter()
+    asyncio.run(run_calls(swarm, agent, messages, context_variables, deepcopy))
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:>10}: {elapsed / num_calls * 1000:8.2f} ms/call, peak memory {peak / 1024 / 1024:8.2f} MB")
+
+
+if __name__ == "__main__":
+    swarm = Swarm(client=InstantClient(), async_client=InstantClient())
+    agent = Agent(name="Bench", model="mock")
+    context_variables = build_context()
+    messages = build_history()
+    print(f"{num_calls} calls, {context_size // 1024} KB context, {history_turns}-turn history")
+    bench("deepcopy", swarm, agent, messages, context_variables, True)
+    bench("layered", swarm, agent, messages, context_variables, False)
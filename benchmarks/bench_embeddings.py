@@ -0,0 +1,66 @@
+import argparse
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from swarm_flow.rag.rag_simple import RAGSimple
+from mock_openai_server import MockOpenAIServer
+
+
+def make_texts(num_texts, seed=0):
+    """Chunks of various lengths, like the output of the chunker"""
+    rng = random.Random(seed)
+    words = ["swarm", "flow", "agent", "workflow", "embedding", "vector", "query", "document", "token", "batch"]
+    return [" ".join(rng.choice(words) for _ in range(rng.randint(20, 400))) for _ in range(num_texts)]
+
+
+def encode_sequential(rag, texts, batch_size=16):
+    """The previous encoding: fixed batches of 16 texts, one request at a time"""
+    embeddings = []
+    for i in range(0, len(texts), batch_size):
+        response = rag.client.embeddings.create(input=texts[i:i + batch_size], model=rag.embedding_model)
+        embeddings.extend(item.embedding for item in response.data)
+    return np.array(embeddings, dtype="float32")
+
+
+def bench(name, func, texts, server):
+    server.requests = 0
+    server.max_in_flight = 0
+    start = time.perf_counter()
+    embeddings = func(texts)
+    elapsed = time.perf_counter() - start
+    print(f"{name:>12}: {elapsed:7.2f} s, {len(texts) / elapsed:8.1f} texts/s, {server.requests} requests, "
+          f"max in-flight {server.max_in_flight}")
+    return embeddings
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingestion throughput of RAGSimple.encode against a fake embedding server")
+    parser.add_argument("--texts", type=int, default=2000, help="Number of texts to encode")
+    parser.add_argument("--latency", type=float, default=0.05, help="Latency of each request in seconds")
+    parser.add_argument("--item-latency", type=float, default=0.001, help="Additional latency of each text in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of the requests failing with a 503 error")
+    parser.add_argument("--concurrency", type=int, default=4, help="Maximum number of concurrent batches")
+    args = parser.parse_args()
+
+    texts = make_texts(args.texts)
+    with MockOpenAIServer(latency=args.latency, item_latency=args.item_latency, error_rate=args.error_rate) as server:
+        rag_params = {
+            "base_url": server.base_url, "api_key": "mock", "embedding_model": "text-embedding-ada-002",
+            "max_batch_items": 256, "max_batch_tokens": 100000, "max_concurrency": args.concurrency,
+            "retry": {"max_attempts": 5, "backoff": 0.05},
+        }
+        rag = RAGSimple({"openai": rag_params}, "openai")
+
+        expected = bench("sequential", lambda t: encode_sequential(rag, t), texts, server)
+        embeddings = bench("concurrent", rag.encode, texts, server)
+        if args.error_rate:
+            print(f"{server.errors} failed requests")
+
+        # The concurrent batches must return the embeddings in the order of the texts
+        assert embeddings.shape == expected.shape and np.array_equal(embeddings, expected), "Embeddings out of order"
@@ -0,0 +1,75 @@
+import argparse
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+# Modules measured in a fresh interpreter each, so that nothing is already imported
+modules = ["swarm_flow.workflow", "swarm_flow.tools", "swarm_flow.rag.rag_simple"]
+
+# Optional dependencies that must only be imported once a tool or RAG provider is used
+deferred = {
+    "swarm_flow.workflow": ["chromadb", "numpy", "duckduckgo_search", "bs4", "requests", "pytz", "tiktoken", "swarm_flow.tools"],
+    "swarm_flow.tools": ["chromadb", "numpy", "duckduckgo_search", "bs4", "requests", "pytz"],
+}
+
+
+def import_time(module, repeat):
+    """Cumulative import time of each module in microseconds, the best of 'repeat' cold starts"""
+    best = None
+    for _ in range(repeat):
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            cwd=root, capture_output=True, text=True
+        )
+        if result.returncode != 0:
+            raise Exception(f"Unable to import '{module}':\n{result.stderr}")
+
+        times = {}
+        for line in result.stderr.splitlines():
+            if not line.startswith("import time:") or "cumulative" in line:
+                continue
+            self_us, cumulative_us, name = line[len("import time:"):].split("|")
+            times[name.strip()] = (int(self_us), int(cumulative_us))
+        if best is None or times[module][1] < best[module][1]:
+            best = times
+    return best
+
+
+def report(module, times, top):
+    total = times[module][1]
+    print(f"{module}: {total / 1000:.1f} ms, {len(times)} modules")
+
+    # Breakdown by top-level package, from the self time of its modules
+    packages = defaultdict(int)
+    for name, (self_us, _) in times.items():
+        packages[name.split(".")[0]] += self_us
+    for package, self_us in sorted(packages.items(), key=lambda x: -x[1])[:top]:
+        print(f"  {package:<30} {self_us / 1000:8.1f} ms")
+
+    imported = [name for name in deferred.get(module, []) if name in times]
+    if imported:
+        print(f"  eagerly imported: {imported}")
+    return total, imported
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cold-start import time of swarm_flow")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of cold starts per module, the best is kept")
+    parser.add_argument("--top", type=int, default=10, help="Number of packages in the breakdown")
+    parser.add_argument("--max-ms", type=float, default=0, help="Fail if 'swarm_flow.workflow' takes longer (0 to disable)")
+    args = parser.parse_args()
+
+    failed = False
+    for module in modules:
+        total, imported = report(module, import_time(module, args.repeat), args.top)
+        if imported:
+            failed = True
+        if module == "swarm_flow.workflow" and args.max_ms and total / 1000 > args.max_ms:
+            print(f"  slower than {args.max_ms} ms")
+            failed = True
+        print()
+
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,66 @@
+import asyncio
+import os
+import sys
+import time
+
+import yaml
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from swarm_flow.plan import WorkflowPlan
+from swarm_flow.workflow import WorkflowExecutor
+
+step_counts = [10, 100, 1000]
+fan_in = 3  # Each step depends on up to 'fan_in' previous steps
+repeat = 5
+
+
+def build_workflow(num_steps):
+    """Synthetic workflow: a layered DAG of steps, alternating sync and async execution"""
+    steps = []
+    for i in range(num_steps):
+        steps.append({
+            "name": f"step-{i}",
+            "order": i,
+            "agent": "Echo",
+            "execution": "async" if i % 2 else "sync",
+            "output": {"name": f"output_{i}", "type": "string"},
+            "prerequisite": [f"step-{j}" for j in range(max(0, i - fan_in), i)],
+        })
+
+    workflow = {
+        "workflow": {"name": "bench", "llm_provider": "openai"},
+        "functions": [],
+        "agents": [{"name": "Echo", "description": "", "instruction": "", "functions": []}],
+        "steps": steps,
+    }
+    return yaml.safe_dump(workflow)
+
+
+async def fake_completion(agent, instructions, *args, **kwargs):
+    # No LLM call and no latency, so the whole time is the scheduling overhead
+    await asyncio.sleep(0)
+    return "ok"
+
+
+def bench(num_steps):
+    plan = WorkflowPlan.from_yaml(build_workflow(num_steps))
+
+    timings = []
+    for _ in range(repeat):
+        # A new session for each repeat, the completed steps of a session are skipped
+        executor = WorkflowExecutor(plan=plan, max_concurrency=num_steps)
+        executor.completion = fake_completion
+        start = time.perf_counter()
+        asyncio.run(executor.run())
+        timings.append(time.perf_counter() - start)
+        if len(executor.completed_steps) != num_steps:
+            raise Exception(f"Only {len(executor.completed_steps)}/{num_steps} steps were executed")
+
+    best = min(timings)
+    print(f"{num_steps:>6} steps: {best * 1000:10.2f} ms total, {best / num_steps * 1e6:8.1f} us/step scheduling overhead")
+
+
+if __name__ == "__main__":
+    for num_steps in step_counts:
+        bench(num_steps)
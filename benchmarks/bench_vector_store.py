@@ -0,0 +1,123 @@
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+build_batch_size = 5000
+
+
+def random_vectors(rng, num, dim):
+    vectors = rng.standard_normal((num, dim), dtype="float32")
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def build(backend, path, size, dim, dtype):
+    """Fill a knowledge base with 'size' random chunks"""
+    rng = np.random.default_rng(0)
+    if backend == "numpy":
+        from swarm_flow.rag.vector_store import NumpyVectorStore
+        collection = NumpyVectorStore(path, dtype).get_or_create_collection("default")
+    else:
+        import chromadb
+        collection = chromadb.PersistentClient(path=path).get_or_create_collection("default")
+
+    for start in range(0, size, build_batch_size):
+        num = min(build_batch_size, size - start)
+        collection.upsert(
+            ids=[f"{i}" for i in range(start, start + num)],
+            embeddings=random_vectors(rng, num, dim),
+            documents=[f"Chunk {i} of the benchmark knowledge base" for i in range(start, start + num)],
+            metadatas=[{"source": f"doc{i // 10}.txt"} for i in range(start, start + num)],
+        )
+
+
+def rss():
+    """Resident memory in MB: anonymous (private to the process) and file-backed (shareable page cache)"""
+    values = {}
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(("RssAnon:", "RssFile:")):
+                key, value = line.split(":")
+                values[key] = int(value.split()[0]) / 1024
+    return values.get("RssAnon", 0.0), values.get("RssFile", 0.0)
+
+
+def measure(backend, path, dim, num_queries, top_k):
+    """Run in a fresh interpreter: open time (imports included), first query, query latency and memory"""
+    start = time.perf_counter()
+    if backend == "numpy":
+        from swarm_flow.rag.vector_store import NumpyVectorStore
+        collection = NumpyVectorStore(path, read_only=True).get_collection("default")
+    else:
+        import chromadb
+        collection = chromadb.PersistentClient(path=path).get_collection("default")
+    open_time = time.perf_counter() - start
+
+    queries = random_vectors(np.random.default_rng(1), num_queries + 1, dim)
+    start = time.perf_counter()
+    collection.query(query_embeddings=queries[:1], n_results=top_k)
+    first_query = time.perf_counter() - start
+
+    latencies = []
+    for query in queries[1:]:
+        start = time.perf_counter()
+        collection.query(query_embeddings=query[None], n_results=top_k)
+        latencies.append(time.perf_counter() - start)
+
+    anon, file = rss()
+    print(json.dumps({
+        "open_ms": open_time * 1000, "first_query_ms": first_query * 1000,
+        "p50_ms": float(np.percentile(latencies, 50)) * 1000, "p95_ms": float(np.percentile(latencies, 95)) * 1000,
+        "rss_anon_mb": anon, "rss_file_mb": file,
+    }))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Numpy memory-mapped vector store against chromadb")
+    parser.add_argument("--sizes", default="10000,100000", help="Numbers of chunks, e.g. 10000,100000,1000000")
+    parser.add_argument("--dim", type=int, default=384, help="Dimension of the embeddings")
+    parser.add_argument("--backends", default="numpy,chromadb", help="Vector stores to compare")
+    parser.add_argument("--dtype", default="float32", help="Embeddings of the numpy store, float32 or float16")
+    parser.add_argument("--queries", type=int, default=50, help="Number of timed queries")
+    parser.add_argument("--top-k", type=int, default=5, help="Number of results per query")
+    parser.add_argument("--measure", nargs=2, metavar=("BACKEND", "PATH"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        measure(args.measure[0], args.measure[1], args.dim, args.queries, args.top_k)
+        sys.exit(0)
+
+    root = tempfile.mkdtemp(prefix="bench_vector_store_")
+    try:
+        print(f"{'backend':>10} {'chunks':>9} {'build s':>9} {'open ms':>9} {'1st query':>10} {'p50 ms':>8} "
+              f"{'p95 ms':>8} {'anon MB':>9} {'file MB':>9}")
+        for size in [int(size) for size in args.sizes.split(",")]:
+            for backend in args.backends.split(","):
+                path = os.path.join(root, f"{backend}_{size}")
+                start = time.perf_counter()
+                build(backend, path, size, args.dim, args.dtype)
+                build_time = time.perf_counter() - start
+
+                # Each store is opened by a new process, like a worker starting
+                result = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), "--measure", backend, path, "--dim", str(args.dim),
+                     "--queries", str(args.queries), "--top-k", str(args.top_k)],
+                    capture_output=True, text=True
+                )
+                if result.returncode != 0:
+                    raise Exception(f"Measure of {backend} failed:\n{result.stderr}")
+                stats = json.loads(result.stdout.strip().splitlines()[-1])
+                print(f"{backend:>10} {size:>9} {build_time:>9.1f} {stats['open_ms']:>9.1f} {stats['first_query_ms']:>10.1f} "
+                      f"{stats['p50_ms']:>8.2f} {stats['p95_ms']:>8.2f} {stats['rss_anon_mb']:>9.1f} {stats['rss_file_mb']:>9.1f}",
+                      flush=True)
+                shutil.rmtree(path, ignore_errors=True)
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
@@ -0,0 +1,183 @@
+import asyncio
+import json
+import random
+import threading
+import time
+
+
+class MockOpenAIServer:
+    def __init__(self, latency: float=0.05, embedding_dim: int=384, host: str="127.0.0.1", port: int=0,
+                 item_latency: float=0.0, error_rate: float=0.0):
+        """
+        Minimal OpenAI compatible HTTP server for benchmarks, it runs in a background thread with its own event loop.
+        Supported endpoints: '/v1/chat/completions' (with or without streaming) and '/v1/embeddings'.
+        :param latency: Simulated processing time of each request in seconds.
+        :param embedding_dim: Dimension of the returned embeddings.
+        :param item_latency: Additional processing time of each embedded text in seconds.
+        :param error_rate: Fraction of the embeddings requests failing with a 503 error.
+        """
+        self.latency = latency
+        self.item_latency = item_latency
+        self.error_rate = error_rate
+        self.random = random.Random(0)
+        self.errors = 0
+        self.embedding_dim = embedding_dim
+        self.host = host
+        self.port = port
+        self.requests = 0
+        self.max_in_flight = 0
+        self.in_flight = 0
+
+        self.loop = None
+        self.server = None
+        self.thread = None
+        self.started = threading.Event()
+
+    @property
+    def base_url(self):
+        return f"http://{self.host}:{self.port}/v1"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve, daemon=True)
+        self.thread.start()
+        self.started.wait()
+        return self
+
+    def stop(self):
+        if self.loop is not None:
+            # Keep-alive connections of pooled clients are still open, close them while the loop is running
+            asyncio.run_coroutine_threadsafe(self.shutdown(), self.loop).result(timeout=5)
+            self.loop.call_soon_threadsafe(self.loop.stop)
+        if self.thread is not None:
+            self.thread.join(timeout=5)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def serve(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.server = self.loop.run_until_complete(
+            asyncio.start_server(self.handle_connection, self.host, self.port, backlog=4096)
+        )
+        self.port = self.server.sockets[0].getsockname()[1]
+        self.started.set()
+        self.loop.run_forever()
+
+    async def shutdown(self):
+        self.server.close()
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode().split(" ", 2)
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    key, value = line.decode().split(":", 1)
+                    headers[key.strip().lower()] = value.strip()
+
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                payload = json.loads(body) if body else {}
+
+                self.requests += 1
+                self.in_flight += 1
+                self.max_in_flight = max(self.max_in_flight, self.in_flight)
+                try:
+                    await asyncio.sleep(self.latency)
+                    if path.endswith("/embeddings"):
+                        texts = payload.get("input") or []
+                        await asyncio.sleep(self.item_latency * (1 if isinstance(texts, str) else len(texts)))
+                        if self.random.random() < self.error_rate:
+                            self.errors += 1
+                            await self.send_json(writer, {"error": {"message": "Mock overload"}}, status="503 Service Unavailable")
+                        else:
+                            await self.send_json(writer, self.embeddings(payload))
+                    elif payload.get("stream"):
+                        await self.send_stream(writer, payload)
+                    else:
+                        await self.send_json(writer, self.chat_completion(payload))
+                finally:
+                    self.in_flight -= 1
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def send_json(writer, data, status: str="200 OK"):
+        body = json.dumps(data).encode()
+        writer.write(
+            f"HTTP/1.1 {status}\r\n".encode() + b"Content-Type: application/json\r\nConnection: keep-alive\r\n"
+            + f"Content-Length: {len(body)}\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+
+    async def send_stream(self, writer, payload):
+        writer.write(
+            b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nConnection: keep-alive\r\n"
+            b"Transfer-Encoding: chunked\r\n\r\n"
+        )
+        words = self.reply(payload).split(" ")
+        for idx, word in enumerate(words):
+            delta = {"content": word if idx == 0 else f" {word}"}
+            if idx == 0:
+                delta["role"] = "assistant"
+            chunk = {
+                "id": "chatcmpl-mock", "object": "chat.completion.chunk", "created": int(time.time()),
+                "model": payload.get("model", "mock"),
+                "choices": [{"index": 0, "delta": delta, "finish_reason": None}],
+            }
+            self.write_chunk(writer, f"data: {json.dumps(chunk)}\n\n".encode())
+            await writer.drain()
+        self.write_chunk(writer, b"data: [DONE]\n\n")
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    @staticmethod
+    def write_chunk(writer, data):
+        writer.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+
+    @staticmethod
+    def reply(payload):
+        messages = payload.get("messages") or [{}]
+        return f"Mock reply to: {str(messages[-1].get('content', ''))[:64]}"
+
+    def chat_completion(self, payload):
+        return {
+            "id": "chatcmpl-mock", "object": "chat.completion", "created": int(time.time()),
+            "model": payload.get("model", "mock"),
+            "choices": [{
+                "index": 0, "finish_reason": "stop",
+                "message": {"role": "assistant", "content": self.reply(payload)},
+            }],
+            "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+        }
+
+    def embeddings(self, payload):
+        texts = payload.get("input") or []
+        if isinstance(texts, str):
+            texts = [texts]
+        data = []
+        for idx, text in enumerate(texts):
+            # Deterministic pseudo embedding of the text
+            seed = sum(text.encode()) % 997
+            data.append({
+                "object": "embedding", "index": idx,
+                "embedding": [((seed + i) % 17) / 17.0 for i in range(self.embedding_dim)],
+            })
+        return {"object": "list", "data": data, "model": payload.get("model", "mock"),
+                "usage": {"prompt_tokens": 1, "total_tokens": 1}}
@@ -15,6 +15,7 @@ from swarm_flow.config import rag_settings
 debug = False
 stream_output = True
 rebuild_kb = True  # If the embedded model is changed, the vector database must be rebuilt.
+# Set "disk_path" of cache_settings["embeddings"] in config.py so that rebuilding reuses the embeddings of unchanged chunks.
 
 workflow_config = f"{root_path}/data/workflows/cn/rag.yaml"
 kb_document = f"{root_path}/data/knowledge_bases/documents/example_cn.txt"
@@ -3,6 +3,7 @@ import json
 import yaml
 import asyncio
 
+from swarm_flow.plan import WorkflowPlan
 from swarm_flow.workflow import WorkflowExecutor
 
 
@@ -98,6 +99,20 @@ def init_chat_history():
 
 def clear_chat_history():
     del st.session_state.messages
+    st.session_state.pop("executor", None)
+
+def get_executor(plan):
+    # One executor per chat session, so that the summary of the history is kept between messages
+    executor = st.session_state.get("executor")
+    if executor is None or executor.plan is not plan or executor.messages is not st.session_state.messages:
+        executor = WorkflowExecutor(
+            plan=plan,
+            messages=st.session_state.messages,
+            context_variables=st.session_state.context_variables,
+            status_callback=set_status,
+        )
+        st.session_state.executor = executor
+    return executor
 
 def set_context_variables(context_variables):
     variables = yaml.safe_load(context_variables)
@@ -350,13 +365,11 @@ with tabs[1]:
     st.divider()
 
     if user_input:
-        # Create and run a workflow executor
-        executor = WorkflowExecutor(
-            yaml_content=json.dumps(st.session_state['yaml_data']),
-            messages=st.session_state.messages,
-            context_variables=st.session_state.context_variables,
-            status_callback=set_status,
-        )
+        # The workflow is compiled once per YAML, the session is recreated when the YAML changes
+        plan = WorkflowPlan.from_yaml(json.dumps(st.session_state['yaml_data']))
+
+        # Run the workflow executor of the chat session
+        executor = get_executor(plan)
 
         output = asyncio.run(executor.run(user_input))
 
@@ -0,0 +1,196 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class MemoryCache:
+    def __init__(self, max_items: int=1024, max_bytes: int=64 * 1024 * 1024):
+        """
+        In-process LRU cache of bytes values with per-entry expiration.
+        :param max_items: Maximum number of entries.
+        :param max_bytes: Maximum total size of the values.
+        """
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def get(self, key: str):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires is not None and expires < time.time():
+                self.remove(key)
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: bytes, ttl: float=None):
+        if len(value) > self.max_bytes:
+            return
+        expires = time.time() + ttl if ttl else None
+        with self.lock:
+            self.remove(key)
+            self.entries[key] = (value, expires)
+            self.size += len(value)
+            while len(self.entries) > self.max_items or self.size > self.max_bytes:
+                _, (old_value, _) = self.entries.popitem(last=False)
+                self.size -= len(old_value)
+
+    def remove(self, key: str):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size -= len(entry[0])
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+
+class SQLiteCache:
+    def __init__(self, path: str, max_bytes: int=1024 * 1024 * 1024):
+        """
+        Persistent cache of bytes values in a SQLite file, with per-entry expiration and size-based eviction.
+        The least recently used entries are evicted once the total size exceeds 'max_bytes'.
+        :param path: Path of the SQLite file.
+        :param max_bytes: Maximum total size of the values.
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, "
+            "expires REAL, accessed REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache(accessed)")
+        self.size = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+
+    def get(self, key: str):
+        entry = self.get_entry(key)
+        return entry[0] if entry is not None else None
+
+    def get_entry(self, key: str):
+        """Get the value and its expiration time"""
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute("SELECT value, expires FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            value, expires = row
+            if expires is not None and expires < now:
+                self.conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                self.size -= len(value)
+                return None
+            self.conn.execute("UPDATE cache SET accessed = ? WHERE key = ?", (now, key))
+        return bytes(value), expires
+
+    def set(self, key: str, value: bytes, ttl: float=None):
+        if len(value) > self.max_bytes:
+            return
+        now = time.time()
+        expires = now + ttl if ttl else None
+        with self.lock:
+            row = self.conn.execute("SELECT size FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                self.size -= row[0]
+            self.conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, size, expires, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, sqlite3.Binary(value), len(value), expires, now)
+            )
+            self.size += len(value)
+            if self.size > self.max_bytes:
+                self.evict(now)
+
+    def evict(self, now: float):
+        """Delete the expired entries, then the least recently used ones until the size limit is met"""
+        self.conn.execute("DELETE FROM cache WHERE expires IS NOT NULL AND expires < ?", (now,))
+        self.size = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+        while self.size > self.max_bytes:
+            rows = self.conn.execute("SELECT key, size FROM cache ORDER BY accessed LIMIT 64").fetchall()
+            if not rows:
+                break
+            self.conn.executemany("DELETE FROM cache WHERE key = ?", [(k,) for k, _ in rows])
+            self.size -= sum(size for _, size in rows)
+
+    def clear(self):
+        with self.lock:
+            self.conn.execute("DELETE FROM cache")
+            self.size = 0
+
+
+class TieredCache:
+    def __init__(self, memory: MemoryCache=None, disk: SQLiteCache=None, ttl: float=None):
+        """
+        Memory tier in front of an optional disk tier, disk hits are promoted to memory.
+        :param ttl: Default time to live of the entries in seconds, None for no expiration.
+        """
+        self.memory = memory if memory is not None else MemoryCache()
+        self.disk = disk
+        self.ttl = ttl
+
+        # Statistics
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+
+    def get(self, key: str):
+        value = self.memory.get(key)
+        if value is not None:
+            self.memory_hits += 1
+            self.bytes_read += len(value)
+            return value
+
+        if self.disk is not None:
+            entry = self.disk.get_entry(key)
+            if entry is not None:
+                value, expires = entry
+                self.disk_hits += 1
+                self.bytes_read += len(value)
+                # The promoted entry expires with the disk entry
+                self.memory.set(key, value, max(expires - time.time(), 0.001) if expires is not None else None)
+                return value
+
+        self.misses += 1
+        return None
+
+    def set(self, key: str, value: bytes, ttl: float=None):
+        ttl = ttl or self.ttl
+        self.bytes_written += len(value)
+        self.memory.set(key, value, ttl)
+        if self.disk is not None:
+            self.disk.set(key, value, ttl)
+
+    def clear(self):
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+    def stats(self):
+        hits = self.memory_hits + self.disk_hits
+        lookups = hits + self.misses
+        return {
+            "hits": hits,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "bytes_read": self.bytes_read,
+            "bytes_written": self.bytes_written,
+            "memory_bytes": self.memory.size,
+            "disk_bytes": self.disk.size if self.disk is not None else 0,
+        }
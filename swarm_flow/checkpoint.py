@@ -0,0 +1,153 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+class CheckpointStore:
+    def __init__(self, path: str):
+        """
+        Append-only checkpoint log of workflow runs in a SQLite file.
+        Each record holds the completed unit (step or 'for_each' item), the context variable deltas and the new messages.
+        :param path: Path of the SQLite file.
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS runs ("
+            "run_id TEXT PRIMARY KEY, workflow_hash TEXT, status TEXT, created REAL, updated REAL)"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS checkpoints ("
+            "seq INTEGER PRIMARY KEY AUTOINCREMENT, run_id TEXT NOT NULL, kind TEXT NOT NULL, data TEXT NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS checkpoints_run ON checkpoints(run_id, seq)")
+
+    def exists(self, run_id: str):
+        with self.lock:
+            row = self.conn.execute("SELECT 1 FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+        return row is not None
+
+    def create_run(self, run_id: str, workflow_hash: str):
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO runs (run_id, workflow_hash, status, created, updated) VALUES (?, ?, ?, ?, ?)",
+                (run_id, workflow_hash, "created", now, now)
+            )
+
+    def append(self, run_id: str, kind: str, data: dict, status: str=None):
+        record = json.dumps(data, ensure_ascii=False, default=str)
+        with self.lock:
+            self.conn.execute("BEGIN")
+            self.conn.execute("INSERT INTO checkpoints (run_id, kind, data) VALUES (?, ?, ?)", (run_id, kind, record))
+            if status is not None:
+                self.conn.execute("UPDATE runs SET status = ?, updated = ? WHERE run_id = ?", (status, time.time(), run_id))
+            self.conn.execute("COMMIT")
+
+    def load(self, run_id: str):
+        """Get the run information and its records in order"""
+        with self.lock:
+            run = self.conn.execute(
+                "SELECT workflow_hash, status, created, updated FROM runs WHERE run_id = ?", (run_id,)
+            ).fetchone()
+            if run is None:
+                return None, []
+            rows = self.conn.execute(
+                "SELECT kind, data FROM checkpoints WHERE run_id = ? ORDER BY seq", (run_id,)
+            ).fetchall()
+        info = {"run_id": run_id, "workflow_hash": run[0], "status": run[1], "created": run[2], "updated": run[3]}
+        return info, [(kind, json.loads(data)) for kind, data in rows]
+
+    def runs(self, status: str=None):
+        with self.lock:
+            if status is None:
+                rows = self.conn.execute("SELECT run_id FROM runs ORDER BY updated DESC").fetchall()
+            else:
+                rows = self.conn.execute(
+                    "SELECT run_id FROM runs WHERE status = ? ORDER BY updated DESC", (status,)
+                ).fetchall()
+        return [row[0] for row in rows]
+
+    def delete(self, run_id: str):
+        with self.lock:
+            self.conn.execute("DELETE FROM checkpoints WHERE run_id = ?", (run_id,))
+            self.conn.execute("DELETE FROM runs WHERE run_id = ?", (run_id,))
+
+
+class ContextTracker:
+    def __init__(self, context_variables: dict, messages: list):
+        """
+        Compute the changes of the context variables and messages since the last checkpoint.
+        Lists, dicts and sets are compared by a hash of their serialized value, so that in-place changes are recorded,
+        the other values by identity. Lists which only grew are recorded as appends.
+        """
+        self.context_variables = context_variables
+        self.messages = messages
+        self.reset()
+
+    def reset(self):
+        # Keeping the values referenced guarantees that their ids are not reused
+        self.values = {name: self.track(value) for name, value in self.context_variables.items()}
+        self.message_count = len(self.messages)
+
+    def track(self, value):
+        return value, len(value) if isinstance(value, list) else None, self.digest(value)
+
+    @staticmethod
+    def digest(value):
+        """Hash of the serialized value of a mutable container, None for the other values"""
+        if not isinstance(value, (list, dict, set)):
+            return None
+        data = json.dumps(value, ensure_ascii=False, default=str)
+        return hashlib.sha256(data.encode("utf-8")).digest()
+
+    def changes(self):
+        """Get the variable operations and new messages, and start tracking from the current state"""
+        ops = []
+        for name, value in self.context_variables.items():
+            tracked = self.values.get(name)
+            current = self.track(value)
+            if tracked is not None:
+                if current[2] is None and tracked[0] is value:
+                    continue
+                if current[2] is not None and current[2] == tracked[2]:
+                    self.values[name] = current
+                    continue
+                # A list which only grew, its previous items are unchanged
+                if (tracked[1] is not None and current[1] is not None and current[1] > tracked[1]
+                        and self.digest(value[:tracked[1]]) == tracked[2]):
+                    ops.append({"op": "extend", "name": name, "value": value[tracked[1]:]})
+                    self.values[name] = current
+                    continue
+            ops.append({"op": "set", "name": name, "value": value})
+            self.values[name] = current
+
+        for name in list(self.values):
+            if name not in self.context_variables:
+                ops.append({"op": "delete", "name": name})
+                del self.values[name]
+
+        messages = self.messages[self.message_count:]
+        self.message_count = len(self.messages)
+        return ops, messages
+
+
+def apply_changes(context_variables: dict, messages: list, ops: list, new_messages: list):
+    """Replay the changes recorded by ContextTracker"""
+    for op in ops:
+        if op["op"] == "set":
+            context_variables[op["name"]] = op["value"]
+        elif op["op"] == "extend":
+            context_variables.setdefault(op["name"], []).extend(op["value"])
+        elif op["op"] == "delete":
+            context_variables.pop(op["name"], None)
+    messages.extend(new_messages)
@@ -0,0 +1,119 @@
+import asyncio
+import threading
+
+from .config import client_settings
+
+
+class LoopBoundClient:
+    def __init__(self, factory):
+        """
+        Async clients keep connections bound to the event loop that opened them, so one client is kept per loop.
+        The client of a loop is closed when the loop shuts down (e.g. at the end of 'asyncio.run()').
+        :param factory: Function creating a new async client.
+        """
+        self.factory = factory
+        # Event loop -> (client, task closing the client)
+        self.clients = {}
+        self.lock = threading.Lock()
+
+    def get(self):
+        loop = asyncio.get_running_loop()
+        with self.lock:
+            entry = self.clients.get(loop)
+            if entry is None:
+                # Loops closed without cancelling their tasks never close their clients, they are released here
+                for closed_loop in [l for l in self.clients if l.is_closed()]:
+                    del self.clients[closed_loop]
+                client = self.factory()
+                entry = (client, loop.create_task(self.close_on_shutdown(loop, client)))
+                self.clients[loop] = entry
+        return entry[0]
+
+    async def close_on_shutdown(self, loop, client):
+        """Wait until the task is cancelled, 'asyncio.run()' cancels the remaining tasks before closing the loop"""
+        try:
+            await loop.create_future()
+        except asyncio.CancelledError:
+            with self.lock:
+                if self.clients.get(loop, (None,))[0] is client:
+                    del self.clients[loop]
+            close = getattr(client, "close", None)
+            if close is not None:
+                await close()
+            raise
+
+
+def http_timeout(read_timeout: float):
+    import httpx
+    return httpx.Timeout(read_timeout, connect=client_settings.get("connect_timeout", 10))
+
+
+def http_limits():
+    import httpx
+    return httpx.Limits(
+        max_connections=client_settings.get("max_connections", 1000),
+        max_keepalive_connections=client_settings.get("max_keepalive_connections", 100),
+        keepalive_expiry=client_settings.get("keepalive_expiry", 30),
+    )
+
+
+def create_openai_client(base_url: str=None, api_key: str="", use_async: bool=False):
+    """Create an OpenAI client with pooled keep-alive connections and the timeouts of 'client_settings'"""
+    import httpx
+    from openai import AsyncOpenAI, OpenAI
+
+    timeout = http_timeout(client_settings.get("llm_timeout", 300))
+    if use_async:
+        http_client = httpx.AsyncClient(limits=http_limits(), timeout=timeout)
+        return AsyncOpenAI(base_url=base_url or None, api_key=api_key, timeout=timeout, http_client=http_client)
+    http_client = httpx.Client(limits=http_limits(), timeout=timeout)
+    return OpenAI(base_url=base_url or None, api_key=api_key, timeout=timeout, http_client=http_client)
+
+
+clients = {}
+clients_lock = threading.Lock()
+def get_client(key: tuple, factory):
+    with clients_lock:
+        client = clients.get(key)
+        if client is None:
+            client = factory()
+            clients[key] = client
+    return client
+
+
+def get_openai_client(base_url: str=None, api_key: str=""):
+    """Get the process-wide OpenAI client of the base URL, shared by Swarm, the tools and RAGSimple"""
+    return get_client(("openai", base_url or "", api_key), lambda: create_openai_client(base_url, api_key))
+
+
+def get_async_openai_client(base_url: str=None, api_key: str=""):
+    """Get the process-wide LoopBoundClient of the base URL, one AsyncOpenAI client per event loop"""
+    return get_client(
+        ("async_openai", base_url or "", api_key),
+        lambda: LoopBoundClient(lambda: create_openai_client(base_url, api_key, use_async=True))
+    )
+
+
+def get_ollama_client(host: str):
+    import ollama
+    return get_client(("ollama", host), lambda: ollama.Client(host=host, timeout=http_timeout(client_settings.get("llm_timeout", 300))))
+
+
+def get_http_session():
+    """Get the process-wide requests session of the tools, pass 'timeout=request_timeout()' to each request"""
+    def create_session():
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=16, pool_maxsize=client_settings.get("max_keepalive_connections", 100))
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    return get_client(("requests",), create_session)
+
+
+def request_timeout():
+    """(connect, read) timeout of the requests of the tools"""
+    return client_settings.get("connect_timeout", 10), client_settings.get("http_timeout", 30)
@@ -4,6 +4,7 @@ llm_settings = {
         "api_key": "sk-xxxx",  # Enter a valid API Key here
         "default_model": "gpt-4o",  # The o1 model does not support function call, so the gpt-4o model is recommended
         "temperature": 0.7,
+        # Budget of the prompts for models of unknown context window, known models use their own context window
         "max_context_tokens": 8192,
         "max_new_tokens": 1024,
     },
@@ -22,16 +23,32 @@ rag_settings = {
         "base_url": "",  # To invoke the OpenAI API directly, leave this field as an empty string
         "api_key": "sk-xxxx",  # Enter a valid API Key here
         "embedding_model": "text-embedding-ada-002",
+        # Texts are encoded in batches of at most 'max_batch_items' texts and 'max_batch_tokens' tokens,
+        # 'max_concurrency' batches are sent at the same time
+        "max_batch_items": 256,
+        "max_batch_tokens": 100000,
+        "max_concurrency": 4,
     },
     "ollama": {
         "host": "localhost:11434",
         "embedding_model": "bge-m3:latest",
+        "max_batch_items": 64,
+        "max_batch_tokens": 16000,
+        "max_concurrency": 2,
     },
     "local": {
         "embedding_model": "sentence-transformers/all-MiniLM-L6-v2",
     },
 }
 
+vector_store_settings = {
+    # 'chromadb', or 'numpy' for the built-in memory-mapped store (see rag/vector_store.py)
+    # Existing knowledge bases are opened with the store that built them
+    "backend": "chromadb",
+    "dtype": "float32",  # Embeddings of the numpy store, 'float16' halves its size
+    "read_only": False,  # Open numpy stores read-only, so that worker processes share one mapping
+}
+
 tool_settings = {
     # If DuckDuckGo cannot be accessed, you need to set up a proxy first.
     "web_search_api": "duckduckgo",  # duckduckgo / searxng
@@ -40,5 +57,55 @@ tool_settings = {
     "searxng": {
         "base_url": "http://localhost:8888/search",
         "search_engine": "google",  # You can specify different search engines (such as 'google'), default is 'general'
-    }
+    },
+    # The tool calls of one assistant turn run concurrently, blocking tools in a pool of 'max_workers' threads
+    "max_workers": 8,
+    "timeout": 60,  # Timeout of each tool call in seconds, the model receives an error message instead
+}
+
+client_settings = {
+    # HTTP clients are shared by the whole process, per provider and base URL, and keep their connections alive
+    "max_connections": 1000,
+    "max_keepalive_connections": 100,
+    "keepalive_expiry": 30,  # Seconds before an idle connection is closed
+    "connect_timeout": 10,
+    "llm_timeout": 300,  # Read timeout of the LLM and embedding requests in seconds
+    "http_timeout": 30,  # Read timeout of the requests of the tools (e.g. 'web_content') in seconds
+}
+
+template_settings = {
+    # Compiled Jinja templates are persisted in this directory so cold starts skip compilation. Leave empty to disable.
+    "bytecode_cache_dir": "",
+}
+
+cache_settings = {
+    # Cache of the LLM responses, steps opt in or out with 'cache: true/false' in the workflow YAML
+    "llm": {
+        "enabled": False,  # Default of the steps that do not set 'cache'
+        "ttl": 7 * 24 * 3600,  # Time to live of the cached responses in seconds
+        "memory_max_items": 1024,
+        "memory_max_bytes": 64 * 1024 * 1024,
+        "disk_path": "",  # Path of the SQLite file of the persistent tier, leave empty to keep the cache in memory only
+        "disk_max_bytes": 1024 * 1024 * 1024,
+    },
+    # Cache of the tool results, for the tools with a time to live (see 'ttl' in registry.py)
+    "tools": {
+        "enabled": True,
+        "memory_max_items": 4096,
+        "memory_max_bytes": 64 * 1024 * 1024,
+        "disk_path": "",  # Path of the SQLite file of the persistent tier, leave empty to keep the cache in memory only
+        "disk_max_bytes": 1024 * 1024 * 1024,
+    },
+    # Cache of the text embeddings of RAGSimple, keyed by the provider, the model and the sha256 of the text
+    "embeddings": {
+        "enabled": True,
+        "disk_path": "",  # Directory of the persistent cache (matrix files and index), leave empty to disable it
+        "dtype": "float32",  # 'float16' halves the size of the matrix files
+        "query_cache_items": 1024,  # In-memory LRU of the query embeddings of 'search()'
+    },
+    # Identical concurrent requests share one in-flight call
+    "single_flight": {
+        "llm": True,
+        "tools": True,
+    },
 }
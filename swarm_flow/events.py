@@ -0,0 +1,105 @@
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Any, Optional
+
+
+@dataclass
+class StepStarted:
+    step: str
+    agent: str
+    type: str = field(default="step_started", init=False)
+
+
+@dataclass
+class StepFinished:
+    step: str
+    output: Any
+    type: str = field(default="step_finished", init=False)
+
+
+@dataclass
+class TokenDelta:
+    step: Optional[str]
+    item_index: Optional[int]
+    agent: Optional[str]
+    content: str
+    type: str = field(default="token_delta", init=False)
+
+
+@dataclass
+class ToolCall:
+    name: str
+    arguments: dict
+    type: str = field(default="tool_call", init=False)
+
+
+@dataclass
+class AgentTransfer:
+    agent: str
+    query: str
+    type: str = field(default="agent_transfer", init=False)
+
+
+@dataclass
+class FinalOutput:
+    output: str
+    type: str = field(default="final_output", init=False)
+
+
+class EventStream:
+    def __init__(self, max_buffered_events: int=256, coalesce_chars: int=32, coalesce_interval: float=0.05):
+        """
+        Bounded async iterator of the workflow events.
+        Producers wait when the buffer is full, so a slow consumer slows the workflow down instead of growing memory.
+        :param max_buffered_events: Maximum number of events waiting for the consumer.
+        :param coalesce_chars: Token deltas of the same step and item are merged until they reach this length.
+        :param coalesce_interval: Maximum time in seconds a token delta is held back for coalescing.
+        """
+        self.queue = asyncio.Queue(maxsize=max_buffered_events)
+        self.coalesce_chars = coalesce_chars
+        self.coalesce_interval = coalesce_interval
+
+        # Token deltas being coalesced, keyed by (step, item_index)
+        self.pending = {}
+        self.pending_since = {}
+
+    async def put(self, event):
+        # Events keep their order, the pending deltas go first
+        await self.flush()
+        await self.queue.put(event)
+
+    async def put_delta(self, step, item_index, agent, content):
+        key = (step, item_index)
+        pending = self.pending.get(key)
+        if pending is None:
+            self.pending[key] = TokenDelta(step=step, item_index=item_index, agent=agent, content=content)
+            self.pending_since[key] = time.monotonic()
+        else:
+            pending.content += content
+
+        if (len(self.pending[key].content) >= self.coalesce_chars
+                or time.monotonic() - self.pending_since[key] >= self.coalesce_interval):
+            await self.flush(key)
+
+    async def flush(self, key=None):
+        """Emit the pending token deltas, of one (step, item_index) or all of them"""
+        keys = list(self.pending) if key is None else [key]
+        for k in keys:
+            delta = self.pending.pop(k, None)
+            self.pending_since.pop(k, None)
+            if delta is not None:
+                await self.queue.put(delta)
+
+    async def close(self):
+        await self.flush()
+        await self.queue.put(None)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        event = await self.queue.get()
+        if event is None:
+            raise StopAsyncIteration
+        return event
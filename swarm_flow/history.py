@@ -0,0 +1,82 @@
+import threading
+
+from .config import rag_settings
+
+# Default settings of the 'history_retrieval' section
+__DEFAULT_HISTORY_RETRIEVAL__ = {
+    "rag_provider": "openai",  # Embedding provider, a subsection name under 'rag_settings' in config.py
+    "top_k": 6,  # Number of the most relevant earlier messages
+    "recent": 4,  # Number of recent messages always sent
+    "max_chars": 4000,  # Longer messages are embedded from their first characters only
+}
+
+
+class HistoryIndex:
+    def __init__(self, encode, max_chars: int=4000):
+        """
+        Embeddings of the conversation history, each message is embedded once.
+        :param encode: Function computing the embeddings of a list of texts (e.g. Embedder.encode).
+        :param max_chars: Longer messages are embedded from their first characters only.
+        """
+        self.encode = encode
+        self.max_chars = max_chars
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        # Normalized embeddings of the first 'count' messages, the array grows by doubling
+        self.vectors = None
+        self.count = 0
+
+    def text(self, message: dict):
+        # Empty inputs are rejected by some embedding APIs
+        return (message.get("content") or "")[:self.max_chars] or " "
+
+    def append(self, vectors):
+        import numpy as np
+
+        vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        if self.vectors is None:
+            self.vectors = np.zeros((max(256, len(vectors)), vectors.shape[1]), dtype="float32")
+        elif self.count + len(vectors) > len(self.vectors):
+            capacity = max(len(self.vectors) * 2, self.count + len(vectors))
+            self.vectors = np.concatenate([self.vectors, np.zeros((capacity - len(self.vectors), vectors.shape[1]), dtype="float32")])
+        self.vectors[self.count:self.count + len(vectors)] = vectors
+        self.count += len(vectors)
+
+    def search(self, messages: list, query: str, top_k: int, recent: int, start: int=0):
+        """
+        Get the indices of the messages to send, in order: the 'top_k' messages most relevant to the query
+        and the 'recent' last messages. Messages before 'start' are not selected.
+        """
+        import numpy as np
+
+        with self.lock:
+            # The new messages are embedded with the query in one request
+            texts = [self.text(message) for message in messages[self.count:]]
+            embeddings = np.asarray(self.encode(texts + [query[:self.max_chars] or " "]), dtype="float32")
+            if texts:
+                self.append(embeddings[:-1])
+            query_vector = embeddings[-1] / max(np.linalg.norm(embeddings[-1]), 1e-12)
+
+            end = max(start, len(messages) - recent)
+            if end - start > top_k:
+                scores = self.vectors[start:end] @ query_vector
+                selected = sorted((np.argpartition(-scores, top_k - 1)[:top_k] + start).tolist())
+            else:
+                selected = list(range(start, end))
+        return selected + list(range(end, len(messages)))
+
+
+embedders = {}
+embedders_lock = threading.Lock()
+def get_embedder(rag_provider: str):
+    """Get the process-wide Embedder of the provider, history embeddings need no vector store"""
+    from .rag.rag_simple import Embedder
+
+    with embedders_lock:
+        embedder = embedders.get(rag_provider)
+        if embedder is None:
+            embedder = Embedder(rag_settings, rag_provider)
+            embedders[rag_provider] = embedder
+    return embedder
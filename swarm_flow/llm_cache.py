@@ -0,0 +1,156 @@
+import hashlib
+import json
+import threading
+
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+
+from .cache import MemoryCache, SQLiteCache, TieredCache
+
+# Request parameters that do not change the generated message
+__IGNORED_PARAMS__ = ("stream", "stream_options")
+
+
+class LLMCache(TieredCache):
+    """
+    Content-addressed cache of chat completions.
+    The key is a stable hash of the endpoint, model, rendered messages, tool schemas and generation parameters,
+    the value is the assistant message, so a cached response can be replayed with or without streaming.
+    """
+
+    @staticmethod
+    def make_key(create_params: dict, tools_key: str=None, endpoint: str=None):
+        """
+        :param create_params: Parameters of the chat completion request.
+        :param tools_key: Precomputed hash of the 'tools' parameter, which is then not serialized again.
+        :param endpoint: Provider and base URL serving the request, the same model name may be served by several endpoints.
+        """
+        params = {k: v for k, v in create_params.items() if k not in __IGNORED_PARAMS__ and v is not None}
+        if tools_key is not None and "tools" in params:
+            params["tools"] = tools_key
+        if endpoint is not None:
+            params["endpoint"] = endpoint
+        data = json.dumps(params, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+        return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+    def get_message(self, key: str):
+        value = self.get(key)
+        if value is None:
+            return None
+        return json.loads(value)
+
+    def set_message(self, key: str, message: dict):
+        self.set(key, json.dumps(message, ensure_ascii=False).encode("utf-8"))
+
+    def wrap_stream(self, key: str, stream):
+        """Forward the chunks of a streamed completion, and cache the message once it is complete"""
+        accumulator = MessageAccumulator()
+        for chunk in stream:
+            accumulator.add(chunk)
+            yield chunk
+        self.set_message(key, accumulator.message())
+
+    async def awrap_stream(self, key: str, stream):
+        accumulator = MessageAccumulator()
+        async for chunk in stream:
+            accumulator.add(chunk)
+            yield chunk
+        self.set_message(key, accumulator.message())
+
+
+def message_from_completion(completion: ChatCompletion):
+    message = completion.choices[0].message
+    return {
+        "role": "assistant",
+        "content": message.content,
+        "tool_calls": [
+            {"id": t.id, "type": t.type, "function": {"name": t.function.name, "arguments": t.function.arguments}}
+            for t in message.tool_calls or []
+        ] or None,
+    }
+
+
+def completion_from_message(model: str, message: dict):
+    return ChatCompletion.model_validate({
+        "id": "chatcmpl-cached",
+        "object": "chat.completion",
+        "created": 0,
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "finish_reason": "tool_calls" if message.get("tool_calls") else "stop",
+            "message": message,
+        }],
+    })
+
+
+def chunks_from_message(model: str, message: dict, chunk_size: int=64):
+    """Replay a cached message as streamed chunks"""
+    def chunk(delta, finish_reason=None):
+        return ChatCompletionChunk.model_validate({
+            "id": "chatcmpl-cached",
+            "object": "chat.completion.chunk",
+            "created": 0,
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        })
+
+    content = message.get("content") or ""
+    yield chunk({"role": "assistant", "content": content[:chunk_size]})
+    for i in range(chunk_size, len(content), chunk_size):
+        yield chunk({"content": content[i:i + chunk_size]})
+
+    for index, tool_call in enumerate(message.get("tool_calls") or []):
+        yield chunk({"tool_calls": [dict(tool_call, index=index)]})
+
+    yield chunk({}, "tool_calls" if message.get("tool_calls") else "stop")
+
+
+async def achunks_from_message(model: str, message: dict, chunk_size: int=64):
+    for chunk in chunks_from_message(model, message, chunk_size):
+        yield chunk
+
+
+class MessageAccumulator:
+    """Rebuild the assistant message from streamed chunks"""
+
+    def __init__(self):
+        self.content = []
+        self.tool_calls = {}
+
+    def add(self, chunk: ChatCompletionChunk):
+        if not chunk.choices:
+            return
+        delta = chunk.choices[0].delta
+        if delta.content:
+            self.content.append(delta.content)
+        for tool_call in delta.tool_calls or []:
+            item = self.tool_calls.setdefault(
+                tool_call.index, {"id": "", "type": "function", "function": {"name": "", "arguments": ""}}
+            )
+            if tool_call.id:
+                item["id"] += tool_call.id
+            if tool_call.function:
+                item["function"]["name"] += tool_call.function.name or ""
+                item["function"]["arguments"] += tool_call.function.arguments or ""
+
+    def message(self):
+        return {
+            "role": "assistant",
+            "content": "".join(self.content),
+            "tool_calls": [self.tool_calls[i] for i in sorted(self.tool_calls)] or None,
+        }
+
+
+llm_caches = {}
+llm_caches_lock = threading.Lock()
+def get_llm_cache(settings: dict):
+    """Get the process-wide LLM cache of the settings (see 'cache_settings' in config.py)"""
+    disk_path = settings.get("disk_path") or ""
+    with llm_caches_lock:
+        llm_cache = llm_caches.get(disk_path)
+        if llm_cache is None:
+            memory = MemoryCache(settings.get("memory_max_items", 1024), settings.get("memory_max_bytes", 64 * 1024 * 1024))
+            disk = SQLiteCache(disk_path, settings.get("disk_max_bytes", 1024 * 1024 * 1024)) if disk_path else None
+            llm_cache = LLMCache(memory, disk, settings.get("ttl"))
+            llm_caches[disk_path] = llm_cache
+    return llm_cache
@@ -0,0 +1,205 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+import yaml
+
+from .swarm import Swarm
+from .clients import get_async_openai_client
+from .swarm.util import function_tools, tools_key
+from .swarm.types import Agent
+from .config import llm_settings, template_settings, cache_settings
+from .llm_cache import get_llm_cache
+from .tool_cache import get_tool_cache
+from .singleflight import llm_flights, tool_flights
+from .templates import get_template_cache
+from .scheduler import StepGraph
+from .retry import RetryPolicy
+from .tokens import get_tokenizer, model_context_tokens
+from .history import __DEFAULT_HISTORY_RETRIEVAL__
+
+
+def step_templates(step):
+    """All templates used by a step"""
+    yield step["agent"]
+    if "for_each" in step:
+        yield step["for_each"].get("format")
+    yield step["output"].get("format")
+    for item in step["output"].get("append_to") or []:
+        yield item.get("format")
+
+# Default settings of the 'compaction' section
+__DEFAULT_COMPACTION__ = {
+    "agent": None,  # Name of the agent writing the summary, a built-in summarizer by default
+    "model": None,  # Model of the built-in summarizer, 'default_model' by default
+    "threshold": 40,  # Compact once this many messages are not summarized
+    "keep": 10,  # Number of recent messages always sent verbatim
+}
+
+__COMPACTION_INSTRUCTIONS__ = """You maintain the running summary of a conversation between a user and an AI assistant.
+Merge the previous summary with the new messages into a concise summary, keeping the facts, decisions, open questions and user preferences needed to continue the conversation.
+Answer with the summary only."""
+
+
+class WorkflowPlan:
+    def __init__(self, yaml_content, template_cache=None):
+        """
+        The compiled workflow: agents, tool schemas, templates and dependency graph.
+        It is built once per YAML and shared read-only by all sessions (WorkflowExecutor) running it.
+        :param yaml_content: The workflow configuration.
+        :param template_cache: Cache of the compiled Jinja2 templates, the process-wide cache by default.
+        """
+        # Compiled Jinja2 templates, shared by the plans of the same process
+        if template_cache is None:
+            template_cache = get_template_cache(template_settings.get("bytecode_cache_dir"))
+        self.template_cache = template_cache
+
+        # Parse YAML content
+        self.workflow = yaml.safe_load(yaml_content)
+        self.workflow_hash = hashlib.sha256(yaml_content.encode("utf-8")).hexdigest()
+
+        # Extract LLM settings
+        self.llm_provider = self.workflow["workflow"]["llm_provider"]
+        self.llm_settings = llm_settings[self.llm_provider]
+        # Identifies the endpoint in the LLM cache keys
+        self.llm_endpoint = f'{self.llm_provider}:{self.llm_settings.get("base_url") or ""}'
+
+        # The LLM clients are shared by all sessions and plans of the same provider
+        self.llm_client = Swarm.create_client(self.llm_settings["base_url"], self.llm_settings["api_key"])
+        self.llm_async_client = get_async_openai_client(self.llm_settings["base_url"], self.llm_settings["api_key"])
+
+        # LLM response cache, used by the steps that opt in
+        self.llm_cache = get_llm_cache(cache_settings["llm"])
+        self.cache = self.workflow["workflow"].get("cache", cache_settings["llm"].get("enabled", False))
+
+        # Tool result cache, shared by all plans
+        tool_cache_settings = cache_settings.get("tools", {})
+        self.tool_cache = get_tool_cache(tool_cache_settings) if tool_cache_settings.get("enabled", True) else None
+
+        # Deduplication of identical concurrent calls, shared by all plans
+        single_flight = cache_settings.get("single_flight", {})
+        self.llm_flights = llm_flights if single_flight.get("llm", True) else None
+        self.tool_flights = tool_flights if single_flight.get("tools", True) else None
+
+        # Token budget of the prompts, agents may override it.
+        # A budget set in the workflow is a hard limit, otherwise the context window of the model is used
+        self.max_context_tokens = self.workflow["workflow"].get("max_context_tokens")
+        self.max_new_tokens = self.workflow["workflow"].get("max_new_tokens", self.llm_settings.get("max_new_tokens", 0))
+
+        # Create the agents dictionary for use in subsequent steps
+        self.agents = {}
+        self.agent_params = {}
+        self.agent_budgets = {}
+        for a in self.workflow["agents"]:
+            functions = []
+            for func_name in a["functions"]:
+                func = self.get_function_from_name(func_name)
+                if func is None:
+                    continue
+                functions.append(func)
+
+            # The tools payload is built once and shared by all requests of the agent
+            tools = function_tools(functions, ("context_variables",))
+
+            # Create agent
+            agent = Agent(
+                name=a["name"],
+                description=a["description"],
+                model=a.get("model") or self.llm_settings["default_model"],
+                instructions=a["instruction"],
+                functions=functions,
+                tool_choice=a.get("tool_choice"),
+                tools=tools,
+                tools_key=tools_key(tools) if tools else None
+            )
+
+            # Save agent for referencing in workflow
+            self.agents[a["name"]] = agent
+            self.agent_params[a["name"]] = a
+
+            # The tool schemas are sent with every request of the agent, count them once
+            tokenizer = get_tokenizer(agent.model)
+            max_context_tokens = a.get("max_context_tokens", self.max_context_tokens)
+            self.agent_budgets[a["name"]] = {
+                "tokenizer": tokenizer,
+                "strict": bool(max_context_tokens),
+                "max_context_tokens": max_context_tokens or model_context_tokens(agent.model)
+                                      or self.llm_settings.get("max_context_tokens"),
+                "max_new_tokens": a.get("max_new_tokens", self.max_new_tokens) or 0,
+                "tool_tokens": tokenizer.count(json.dumps(tools, ensure_ascii=False)) if tools else 0,
+            }
+
+        # Optional compaction of the history, older turns are replaced by a summary
+        self.compaction = self.workflow["workflow"].get("compaction")
+        self.compaction_agent = None
+        if self.compaction:
+            # 'compaction: true' enables the default settings
+            self.compaction = dict(__DEFAULT_COMPACTION__, **(self.compaction if isinstance(self.compaction, dict) else {}))
+            self.compaction_agent = self.agents.get(self.compaction["agent"]) or Agent(
+                name="Compaction",
+                model=self.compaction.get("model") or self.llm_settings["default_model"],
+                instructions=__COMPACTION_INSTRUCTIONS__,
+            )
+
+        # Optional selection of the history by relevance, agents may opt out with 'history_retrieval: false'
+        self.history_retrieval = self.workflow["workflow"].get("history_retrieval")
+        if self.history_retrieval:
+            self.history_retrieval = dict(
+                __DEFAULT_HISTORY_RETRIEVAL__,
+                **(self.history_retrieval if isinstance(self.history_retrieval, dict) else {})
+            )
+
+        # Sort the steps according to the 'order' field
+        self.steps = sorted(self.workflow["steps"], key=lambda x: x["order"])
+
+        # Build a dictionary for steps to access by name
+        self.steps_dict = {step["name"]: step for step in self.steps}
+
+        # Compile all templates once, rendering only looks them up
+        self.template_cache.compile(agent.instructions for agent in self.agents.values())
+        for step in self.steps:
+            self.template_cache.compile(step_templates(step))
+
+        # Build the dependency graph once, cyclic dependencies are rejected here
+        self.step_graph = StepGraph(self.steps)
+
+        # Retry policies: workflow default, steps and 'for_each' items (defaulting to their step)
+        self.retry_policy = RetryPolicy.from_config(self.workflow["workflow"].get("retry"))
+        self.step_retry_policies = {}
+        self.item_retry_policies = {}
+        for step in self.steps:
+            step_policy = RetryPolicy.from_config(step.get("retry"), self.retry_policy)
+            self.step_retry_policies[step["name"]] = step_policy
+            if "for_each" in step:
+                self.item_retry_policies[step["name"]] = RetryPolicy.from_config(step["for_each"].get("retry"), step_policy)
+
+    def get_function_from_name(self, func_name):
+        for func in self.workflow.get("functions", []):
+            if func["name"] == func_name:
+                return func
+        return None
+
+    @classmethod
+    def from_yaml(cls, yaml_content, template_cache=None):
+        """Get the compiled plan of the YAML, compile it on the first use"""
+        key = (hashlib.sha256(yaml_content.encode("utf-8")).hexdigest(), template_cache)
+        with plans_lock:
+            plan = plans.get(key)
+            if plan is not None:
+                plans.move_to_end(key)
+                return plan
+
+        plan = cls(yaml_content, template_cache)
+
+        with plans_lock:
+            plans[key] = plan
+            if len(plans) > max_plans:
+                plans.popitem(last=False)
+        return plan
+
+
+# Compiled plans keyed by the hash of their YAML
+max_plans = 64
+plans = OrderedDict()
+plans_lock = threading.Lock()
@@ -0,0 +1,187 @@
+import hashlib
+import os
+import sqlite3
+import threading
+
+import numpy as np
+
+# Maximum number of hashes in one SQLite query
+__MAX_QUERY_HASHES__ = 500
+
+
+class EmbeddingCache:
+    def __init__(self, path: str, dtype: str="float32"):
+        """
+        Persistent cache of text embeddings, keyed by the provider, the model and the sha256 of the text.
+        The embeddings of each provider and model are the rows of one matrix file, 'index.sqlite' maps the hash of
+        each text to its row. Changing the model uses new files, so the entries of the previous model never match.
+        :param path: Directory of the cache.
+        :param dtype: 'float32', or 'float16' to halve the size of the matrix files.
+        """
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(os.path.join(path, "index.sqlite"), check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS namespaces ("
+            "namespace TEXT PRIMARY KEY, provider TEXT NOT NULL, model TEXT NOT NULL, dim INTEGER NOT NULL)"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "namespace TEXT NOT NULL, hash BLOB NOT NULL, row INTEGER NOT NULL, PRIMARY KEY (namespace, hash)"
+            ") WITHOUT ROWID"
+        )
+
+        # Read-only mappings of the matrix files: namespace -> (matrix, number of rows)
+        self.matrices = {}
+
+        # Statistics
+        self.hits = 0
+        self.misses = 0
+
+    def namespace(self, provider: str, model: str):
+        return hashlib.sha256(f"{provider}\0{model}\0{self.dtype.name}".encode("utf-8")).hexdigest()[:32]
+
+    def matrix_path(self, namespace: str):
+        return os.path.join(self.path, f"{namespace}.{self.dtype.name}")
+
+    @staticmethod
+    def hash(text: str):
+        return hashlib.sha256(text.encode("utf-8")).digest()
+
+    def get(self, provider: str, model: str, texts: list):
+        """Get the cached embeddings of the texts as float32 arrays, None for the texts not in the cache"""
+        namespace = self.namespace(provider, model)
+        hashes = [self.hash(text) for text in texts]
+        with self.lock:
+            row = self.conn.execute("SELECT dim FROM namespaces WHERE namespace = ?", (namespace,)).fetchone()
+            rows = {}
+            if row is not None:
+                unique = list(set(hashes))
+                for i in range(0, len(unique), __MAX_QUERY_HASHES__):
+                    chunk = unique[i:i + __MAX_QUERY_HASHES__]
+                    rows.update(self.conn.execute(
+                        f"SELECT hash, row FROM embeddings WHERE namespace = ? AND hash IN ({','.join('?' * len(chunk))})",
+                        [namespace] + chunk
+                    ).fetchall())
+            matrix = self.load_matrix(namespace, row[0], max(rows.values()) + 1) if rows else None
+
+        embeddings = [None] * len(texts)
+        if rows:
+            for i, text_hash in enumerate(hashes):
+                matrix_row = rows.get(text_hash)
+                if matrix_row is not None and matrix_row < len(matrix):
+                    embeddings[i] = np.asarray(matrix[matrix_row], dtype="float32")
+
+        hits = sum(1 for embedding in embeddings if embedding is not None)
+        self.hits += hits
+        self.misses += len(texts) - hits
+        return embeddings
+
+    def load_matrix(self, namespace: str, dim: int, min_rows: int):
+        """Map the matrix file of the namespace, it is mapped again once it has grown past the mapped rows"""
+        matrix, rows = self.matrices.get(namespace, (None, 0))
+        if matrix is not None and rows >= min_rows:
+            return matrix
+
+        path = self.matrix_path(namespace)
+        rows = os.path.getsize(path) // (dim * self.dtype.itemsize) if os.path.exists(path) else 0
+        if rows == 0:
+            return np.zeros((0, dim), dtype=self.dtype)
+        matrix = np.memmap(path, dtype=self.dtype, mode="r", shape=(rows, dim))
+        self.matrices[namespace] = (matrix, rows)
+        return matrix
+
+    def set(self, provider: str, model: str, texts: list, embeddings):
+        """Append the embeddings of the texts that are not cached yet"""
+        if len(texts) == 0:
+            return
+        embeddings = np.asarray(embeddings, dtype=self.dtype)
+        namespace = self.namespace(provider, model)
+        dim = embeddings.shape[1]
+        row_bytes = dim * self.dtype.itemsize
+
+        with self.lock:
+            # The write lock of SQLite also serializes the appends of other processes
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.conn.execute("SELECT dim FROM namespaces WHERE namespace = ?", (namespace,)).fetchone()
+                if row is not None and row[0] != dim:
+                    # The model now returns embeddings of another dimension, the previous ones are stale
+                    self.reset(namespace)
+                    row = None
+                if row is None:
+                    self.conn.execute(
+                        "INSERT INTO namespaces (namespace, provider, model, dim) VALUES (?, ?, ?, ?)",
+                        (namespace, provider, model, dim)
+                    )
+
+                new = {}
+                for text, embedding in zip(texts, embeddings):
+                    new.setdefault(self.hash(text), embedding)
+                unique = list(new)
+                for i in range(0, len(unique), __MAX_QUERY_HASHES__):
+                    chunk = unique[i:i + __MAX_QUERY_HASHES__]
+                    for (text_hash,) in self.conn.execute(
+                        f"SELECT hash FROM embeddings WHERE namespace = ? AND hash IN ({','.join('?' * len(chunk))})",
+                        [namespace] + chunk
+                    ):
+                        new.pop(text_hash, None)
+
+                if new:
+                    path = self.matrix_path(namespace)
+                    with open(path, "ab") as f:
+                        # Rows of an interrupted append are overwritten
+                        start = f.tell() // row_bytes
+                        f.truncate(start * row_bytes)
+                        f.seek(start * row_bytes)
+                        f.write(np.stack(list(new.values())).tobytes())
+                    self.conn.executemany(
+                        "INSERT INTO embeddings (namespace, hash, row) VALUES (?, ?, ?)",
+                        [(namespace, text_hash, start + i) for i, text_hash in enumerate(new)]
+                    )
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def reset(self, namespace: str):
+        self.conn.execute("DELETE FROM embeddings WHERE namespace = ?", (namespace,))
+        self.conn.execute("DELETE FROM namespaces WHERE namespace = ?", (namespace,))
+        self.matrices.pop(namespace, None)
+        path = self.matrix_path(namespace)
+        if os.path.exists(path):
+            os.remove(path)
+
+    def clear(self):
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            for (namespace,) in self.conn.execute("SELECT namespace FROM namespaces").fetchall():
+                self.reset(namespace)
+            self.conn.execute("COMMIT")
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+embedding_caches = {}
+embedding_caches_lock = threading.Lock()
+def get_embedding_cache(settings: dict):
+    """Get the process-wide embedding cache of the settings (see 'cache_settings' in config.py), None when disabled"""
+    disk_path = settings.get("disk_path") or ""
+    if not settings.get("enabled", True) or not disk_path:
+        return None
+    with embedding_caches_lock:
+        embedding_cache = embedding_caches.get(disk_path)
+        if embedding_cache is None:
+            embedding_cache = EmbeddingCache(disk_path, settings.get("dtype", "float32"))
+            embedding_caches[disk_path] = embedding_cache
+    return embedding_cache
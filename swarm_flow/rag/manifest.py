@@ -0,0 +1,83 @@
+import hashlib
+import json
+import os
+import threading
+
+
+class ManifestStore:
+    def __init__(self, path: str=None):
+        """
+        Manifests of the source files ingested in each knowledge base: file fingerprint and IDs of the chunks.
+        :param path: Directory of the '<kb_name>.json' manifests, None to keep them in memory only.
+        """
+        self.path = path
+        self.manifests = {}
+        self.lock = threading.Lock()
+
+    def manifest_path(self, kb_name: str):
+        return os.path.join(self.path, f"{kb_name}.json")
+
+    def get(self, kb_name: str):
+        """Get the manifests of the knowledge base: source path -> manifest"""
+        with self.lock:
+            manifests = self.manifests.get(kb_name)
+            if manifests is None:
+                manifests = {}
+                if self.path is not None and os.path.exists(self.manifest_path(kb_name)):
+                    with open(self.manifest_path(kb_name), "r", encoding="utf-8") as f:
+                        manifests = json.load(f)
+                self.manifests[kb_name] = manifests
+        return manifests
+
+    def set(self, kb_name: str, key: str, manifest: dict):
+        self.get(kb_name)
+        with self.lock:
+            self.manifests[kb_name][key] = manifest
+
+    def remove(self, kb_name: str, key: str):
+        self.get(kb_name)
+        with self.lock:
+            return self.manifests[kb_name].pop(key, None)
+
+    def keys(self, kb_name: str):
+        self.get(kb_name)
+        with self.lock:
+            return list(self.manifests[kb_name])
+
+    def save(self, kb_name: str):
+        if self.path is None:
+            return
+        with self.lock:
+            os.makedirs(self.path, exist_ok=True)
+            # Written to a temporary file first, an interrupted save keeps the previous manifests
+            temp_path = self.manifest_path(kb_name) + ".tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(self.manifests.get(kb_name, {}), f, ensure_ascii=False)
+            os.replace(temp_path, self.manifest_path(kb_name))
+
+    def delete(self, kb_name: str):
+        with self.lock:
+            self.manifests.pop(kb_name, None)
+            if self.path is not None and os.path.exists(self.manifest_path(kb_name)):
+                os.remove(self.manifest_path(kb_name))
+
+
+def file_hash(path: str):
+    """sha256 of the content of a file"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunk_ids(source: str, texts: list):
+    """Content-derived IDs of the chunks of a source, repeated chunks get an occurrence suffix"""
+    ids = []
+    seen = {}
+    for text in texts:
+        chunk_id = hashlib.sha256(f"{source}\0{text}".encode("utf-8")).hexdigest()[:32]
+        count = seen.get(chunk_id, 0)
+        seen[chunk_id] = count + 1
+        ids.append(chunk_id if count == 0 else f"{chunk_id}-{count}")
+    return ids
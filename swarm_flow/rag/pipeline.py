@@ -0,0 +1,305 @@
+import argparse
+import os
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .manifest import chunk_ids
+from .rag_simple import __DOCUMENT_EXTENSIONS__, __UPSERT_BATCH_SIZE__
+from .semchunk import chunkerify
+from ..tokens import get_tokenizer
+
+# End of the items of a stage
+__DONE__ = object()
+
+
+class PipelineStopped(Exception):
+    """Another stage of the pipeline failed"""
+
+
+def find_documents(paths: list):
+    """Yield the supported documents of the paths, directories are walked recursively"""
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    if name.endswith(__DOCUMENT_EXTENSIONS__):
+                        yield os.path.join(root, name)
+        elif path.endswith(__DOCUMENT_EXTENSIONS__):
+            yield path
+        else:
+            print(f"Unsupported file format: {path}")
+
+
+class KBBuilder:
+    def __init__(self, rag, kb_name: str="default", chunk_size: int=500, read_workers: int=4, chunk_processes: int=1,
+                 embed_workers: int=2, batch_size: int=256, queue_size: int=64, prune: bool=True,
+                 report_interval: float=0):
+        """
+        Streaming knowledge base build: documents are read, chunked, embedded and written by concurrent stages
+        connected by bounded queues, so memory stays flat whatever the size of the corpus.
+        Ingestion is incremental like RAGSimple.add_documents, unchanged documents are skipped.
+        :param rag: RAGSimple client of the knowledge base.
+        :param read_workers: Number of threads reading the documents and extracting the text of PDF files.
+        :param chunk_processes: Number of processes chunking the documents (requires 'mpire'), 1 to chunk in a thread.
+        :param embed_workers: Number of batches embedded at the same time, each batch is also split by RAGSimple.encode.
+        :param batch_size: Number of chunks per embedded and written batch.
+        :param queue_size: Maximum number of documents read ahead of the chunking stage.
+        :param prune: Delete the chunks of the ingested files that no longer exist.
+        :param report_interval: Print the progress every 'report_interval' seconds, 0 to disable.
+        """
+        self.rag = rag
+        self.kb_name = kb_name
+        self.chunk_size = chunk_size
+        self.read_workers = read_workers
+        self.chunk_processes = chunk_processes
+        self.embed_workers = embed_workers
+        self.batch_size = min(batch_size, __UPSERT_BATCH_SIZE__)
+        self.queue_size = queue_size
+        self.prune = prune
+        self.report_interval = report_interval
+        self.tokenizer = get_tokenizer(rag.embedding_model)
+
+        self.stop = threading.Event()
+        self.errors = []
+        self.stats = {}
+        self.stats_lock = threading.Lock()
+        self.start_time = 0.0
+        self.last_report = 0.0
+
+    def put(self, q: queue.Queue, item):
+        """Blocking put, interrupted once another stage has failed"""
+        while True:
+            if self.stop.is_set():
+                raise PipelineStopped()
+            try:
+                q.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def get(self, q: queue.Queue):
+        while True:
+            if self.stop.is_set():
+                raise PipelineStopped()
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                pass
+
+    def run_stage(self, func, *args):
+        try:
+            func(*args)
+        except PipelineStopped:
+            pass
+        except BaseException as e:
+            self.errors.append(e)
+            self.stop.set()
+
+    def read_documents(self, document_paths, documents: queue.Queue):
+        """Stage 1: check the documents against their manifest and read the changed ones"""
+        def read(doc_path):
+            try:
+                manifest = self.rag.check_document(doc_path, self.chunk_size, self.kb_name)
+                if manifest is None:
+                    with self.stats_lock:
+                        self.stats["unchanged"] += 1
+                    return
+                self.put(documents, (manifest, self.rag.read_document(doc_path)))
+            finally:
+                in_flight.release()
+
+        # Documents are submitted as the workers become free, not all at once
+        in_flight = threading.BoundedSemaphore(self.read_workers * 2)
+        with ThreadPoolExecutor(max_workers=self.read_workers) as executor:
+            futures = []
+            for doc_path in find_documents(document_paths):
+                while not in_flight.acquire(timeout=0.1):
+                    if self.stop.is_set():
+                        raise PipelineStopped()
+                futures.append(executor.submit(read, doc_path))
+
+                # Errors of the finished reads stop the pipeline
+                pending = []
+                for future in futures:
+                    if future.done():
+                        future.result()
+                    else:
+                        pending.append(future)
+                futures = pending
+            for future in futures:
+                future.result()
+        self.put(documents, __DONE__)
+
+    def chunk_documents(self, documents: queue.Queue, batches: queue.Queue, embed_executor: ThreadPoolExecutor):
+        """Stage 2: chunk the documents, and submit batches of chunks to the embedding stage"""
+        chunker = chunkerify(lambda text: len(text), self.chunk_size)
+        pool = None
+        if self.chunk_processes > 1:
+            import mpire
+            pool = mpire.WorkerPool(self.chunk_processes, use_dill=True, keep_alive=True)
+
+        try:
+            items, finished, done = [], [], False
+            while not done:
+                # Documents read so far are chunked together, so that the processes share the work
+                group = [self.get(documents)]
+                while len(group) < max(self.chunk_processes * 4, 1):
+                    try:
+                        group.append(documents.get_nowait())
+                    except queue.Empty:
+                        break
+                if group[-1] is __DONE__:
+                    group.pop()
+                    done = True
+                if not group:
+                    continue
+
+                texts = chunker([text for _, text in group], pool=pool) if pool is not None \
+                    else [chunker(text) for _, text in group]
+                for (manifest, _), chunks in zip(group, texts):
+                    ids = chunk_ids(manifest["source"], chunks)
+                    for chunk_id, chunk in zip(ids, chunks):
+                        items.append((chunk_id, chunk, {"source": manifest["source"]}, self.tokenizer.count(chunk)))
+                        if len(items) >= self.batch_size:
+                            self.submit(items, finished, batches, embed_executor)
+                            items, finished = [], []
+                    # A document is committed with the batch holding its last chunk
+                    finished.append((manifest, ids))
+
+            if items or finished:
+                self.submit(items, finished, batches, embed_executor)
+            self.put(batches, __DONE__)
+        finally:
+            if pool is not None:
+                pool.terminate()
+
+    def submit(self, items, finished, batches: queue.Queue, embed_executor: ThreadPoolExecutor):
+        # The queue holds at most 'embed_workers' pending batches, it blocks the chunking stage when full
+        self.put(batches, (items, finished, embed_executor.submit(self.embed, items)))
+
+    def embed(self, items):
+        """Stage 3: embed the chunks that are not in the knowledge base yet"""
+        if self.stop.is_set():
+            raise PipelineStopped()
+        collection = self.rag.get_collection(self.kb_name)
+        existing = set(collection.get(ids=[chunk_id for chunk_id, _, _, _ in items], include=[])["ids"])
+        new = [item for item in items if item[0] not in existing]
+        return new, self.rag.encode([text for _, text, _, _ in new]) if new else []
+
+    def write(self, batches: queue.Queue):
+        """Stage 4: write the batches in order, then record the manifests of the finished documents"""
+        collection = self.rag.get_collection(self.kb_name)
+        while True:
+            batch = self.get(batches)
+            if batch is __DONE__:
+                return
+            items, finished, future = batch
+            new, embeddings = future.result()
+            if new:
+                collection.upsert(
+                    embeddings=embeddings,
+                    documents=[text for _, text, _, _ in new],
+                    metadatas=[metadata for _, _, metadata, _ in new],
+                    ids=[chunk_id for chunk_id, _, _, _ in new]
+                )
+            self.stats["chunks"] += len(items)
+            self.stats["tokens"] += sum(tokens for _, _, _, tokens in items)
+            self.stats["added"] += len(new)
+            for manifest, ids in finished:
+                self.stats["deleted"] += self.rag.commit_document(manifest, ids, self.kb_name, save=False)
+                self.stats["docs"] += 1
+            if finished:
+                self.rag.manifests.save(self.kb_name)
+            self.report()
+
+    def build(self, document_paths: list):
+        """
+        Build or update the knowledge base from documents and directories.
+        :return: Numbers of updated documents ('docs'), unchanged documents, chunks, added and deleted chunks, tokens
+                 of the chunks and elapsed seconds.
+        """
+        self.stop.clear()
+        self.errors = []
+        self.stats = {"docs": 0, "unchanged": 0, "chunks": 0, "added": 0, "deleted": 0, "tokens": 0, "elapsed": 0.0}
+        self.start_time = self.last_report = time.perf_counter()
+
+        documents = queue.Queue(maxsize=self.queue_size)
+        batches = queue.Queue(maxsize=max(self.embed_workers, 1))
+        with ThreadPoolExecutor(max_workers=max(self.embed_workers, 1)) as embed_executor:
+            stages = [
+                threading.Thread(target=self.run_stage, args=(self.read_documents, document_paths, documents), daemon=True),
+                threading.Thread(target=self.run_stage, args=(self.chunk_documents, documents, batches, embed_executor), daemon=True),
+            ]
+            for stage in stages:
+                stage.start()
+            self.run_stage(self.write, batches)
+            for stage in stages:
+                stage.join()
+
+        if self.errors:
+            raise self.errors[0]
+
+        if self.prune:
+            self.stats["deleted"] += self.rag.prune_documents(self.kb_name)
+        self.rag.manifests.save(self.kb_name)
+        self.stats["elapsed"] = time.perf_counter() - self.start_time
+        return self.stats
+
+    def report(self, force: bool=False):
+        now = time.perf_counter()
+        if not force and (not self.report_interval or now - self.last_report < self.report_interval):
+            return
+        self.last_report = now
+        print(format_stats(self.stats, now - self.start_time), flush=True)
+
+
+def format_stats(stats: dict, elapsed: float):
+    elapsed = max(elapsed, 1e-9)
+    return (
+        f"{stats['docs']} docs ({stats['docs'] / elapsed:.1f} docs/s), "
+        f"{stats['chunks']} chunks ({stats['chunks'] / elapsed:.1f} chunks/s), "
+        f"{stats['tokens']} tokens ({stats['tokens'] / elapsed:.0f} tokens/s), "
+        f"{stats['added']} added, {stats['deleted']} deleted, {stats['unchanged']} unchanged docs, {elapsed:.1f} s"
+    )
+
+
+def main(argv: list=None):
+    from .rag_simple import RAGSimple
+    from ..config import rag_settings
+
+    parser = argparse.ArgumentParser(
+        prog="python -m swarm_flow.rag.pipeline",
+        description="Build or update a knowledge base from .txt and .pdf documents"
+    )
+    parser.add_argument("paths", nargs="+", help="Documents, directories are walked recursively")
+    parser.add_argument("--kb-path", required=True, help="Directory of the vector database")
+    parser.add_argument("--kb-name", default="default", help="Name of the knowledge base")
+    parser.add_argument("--rag-provider", default="openai", help="Embedding provider, a subsection name under 'rag_settings' in config.py")
+    parser.add_argument("--vector-store", choices=["chromadb", "numpy"], default=None,
+                        help="Vector store of a new knowledge base, 'vector_store_settings' in config.py by default")
+    parser.add_argument("--chunk-size", type=int, default=500, help="Maximum number of characters per chunk")
+    parser.add_argument("--read-workers", type=int, default=4, help="Number of threads reading the documents")
+    parser.add_argument("--chunk-processes", type=int, default=1, help="Number of processes chunking the documents")
+    parser.add_argument("--embed-workers", type=int, default=2, help="Number of batches embedded at the same time")
+    parser.add_argument("--batch-size", type=int, default=256, help="Number of chunks per batch")
+    parser.add_argument("--no-prune", action="store_true", help="Keep the chunks of the ingested files that no longer exist")
+    parser.add_argument("--report-interval", type=float, default=5, help="Seconds between progress reports, 0 to disable")
+    args = parser.parse_args(argv)
+
+    rag = RAGSimple(rag_settings, args.rag_provider, args.kb_path, vector_store=args.vector_store)
+    builder = KBBuilder(
+        rag, kb_name=args.kb_name, chunk_size=args.chunk_size, read_workers=args.read_workers,
+        chunk_processes=args.chunk_processes, embed_workers=args.embed_workers, batch_size=args.batch_size,
+        prune=not args.no_prune, report_interval=args.report_interval,
+    )
+    stats = builder.build(args.paths)
+    print(format_stats(stats, stats["elapsed"]))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,9 +1,24 @@
+import os
+import threading
 import numpy as np
-import chromadb
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from typing import List
 
+from .embedding_cache import get_embedding_cache
+from .manifest import ManifestStore, chunk_ids, file_hash
 from .rag_base import RAGBase
 from .semchunk import chunkerify
+from .vector_store import NumpyVectorStore
+from ..clients import get_ollama_client, get_openai_client
+from ..config import cache_settings, vector_store_settings
+from ..retry import RetryPolicy
+from ..tokens import get_tokenizer
+
+# Maximum number of chunks per read or write of the vector database
+__UPSERT_BATCH_SIZE__ = 1000
+# Supported document formats
+__DOCUMENT_EXTENSIONS__ = (".txt", ".pdf")
 
 """
 # rag_settings example:
@@ -24,81 +39,188 @@ rag_settings = {
 }
 """
 
-class RAGSimple(RAGBase):
-    def __init__(self, rag_settings: dict, rag_provider: str, kb_path: str=None):
-        """Initialize custom RAG module"""
-        super().__init__()
+class Embedder:
+    def __init__(self, rag_settings: dict, rag_provider: str, embedding_cache=None):
+        """
+        Compute the embeddings of texts with the provider, without any vector store.
+        :param embedding_cache: EmbeddingCache consulted before the provider, 'cache_settings["embeddings"]' by default.
+        """
         self.rag_provider = rag_provider
         self.rag_params = rag_settings[rag_provider]
         self.embedding_model = self.rag_params["embedding_model"]
-        self.collections = {}
+
+        # Retry policy of each batch of embeddings
+        self.retry_policy = RetryPolicy.from_config(self.rag_params.get("retry"), RetryPolicy(max_attempts=3))
+
+        # Embeddings of the texts already encoded
+        settings = cache_settings.get("embeddings", {})
+        self.embedding_cache = embedding_cache if embedding_cache is not None else get_embedding_cache(settings)
 
         # Initialize embedding model
         if self.rag_provider == "local":
             from sentence_transformers import SentenceTransformer
             self.client = SentenceTransformer(self.embedding_model)
         elif self.rag_provider == "openai":
-            import openai
-            api_key = self.rag_params["api_key"]
-            base_url = self.rag_params.get("base_url")
-            if base_url and len(base_url) > 0:
-                self.client = openai.Client(base_url=base_url, api_key=api_key)
-            else:
-                self.client = openai.Client(api_key=api_key)
+            # The clients are shared by the whole process
+            self.client = get_openai_client(self.rag_params.get("base_url"), self.rag_params["api_key"])
         elif self.rag_provider == "ollama":
-            import ollama
             # Initialize Ollama API
-            self.client = ollama.Client(host=self.rag_params["host"])
+            self.client = get_ollama_client(self.rag_params["host"])
         else:
             raise ValueError(f"Unsupported embedding method: {self.rag_provider}")
 
-        self.kb_client = None
-        self.init_kb(kb_path)
+    def encode(self, texts: List[str], batch_size: int=None):
+        """
+        Compute text embeddings, compatible with various methods.
+        Batches are sized by 'max_batch_items' (or 'batch_size') and 'max_batch_tokens', and up to 'max_concurrency'
+        of them are sent at the same time. Failed batches are retried alone, the embeddings keep the order of the texts.
+        Texts found in the embedding cache are not sent to the provider.
+        """
+        if self.embedding_cache is None or len(texts) == 0:
+            return self.encode_texts(texts, batch_size)
 
-    def init_kb(self, kb_path: str=None):
-        """Initialize knowledge base"""
-        if kb_path is None:
-            self.kb_client = chromadb.Client()
+        embeddings = self.embedding_cache.get(self.rag_provider, self.embedding_model, texts)
+        missing = list(dict.fromkeys(text for text, embedding in zip(texts, embeddings) if embedding is None))
+        if missing:
+            new_embeddings = self.encode_texts(missing, batch_size)
+            self.embedding_cache.set(self.rag_provider, self.embedding_model, missing, new_embeddings)
+            new_embeddings = dict(zip(missing, new_embeddings))
+            embeddings = [new_embeddings[text] if embedding is None else embedding for text, embedding in zip(texts, embeddings)]
+
+        return np.array(embeddings, dtype="float32")
+
+    def encode_texts(self, texts: List[str], batch_size: int=None):
+        """Compute the embeddings with the provider"""
+        batches = self.make_batches(texts, batch_size or self.rag_params.get("max_batch_items", 16))
+        max_concurrency = self.rag_params.get("max_concurrency", 1) if self.rag_provider != "local" else 1
+
+        if max_concurrency <= 1 or len(batches) <= 1:
+            results = [self.encode_batch(texts[start:end]) for start, end in batches]
         else:
-            self.kb_client = chromadb.PersistentClient(path=kb_path)
+            with ThreadPoolExecutor(max_workers=min(max_concurrency, len(batches))) as executor:
+                results = list(executor.map(lambda batch: self.encode_batch(texts[batch[0]:batch[1]]), batches))
+
+        embeddings = [embedding for batch_embeddings in results for embedding in batch_embeddings]
+        embeddings = np.array(embeddings, dtype="float32")
+
+        return embeddings
+
+    def make_batches(self, texts: List[str], max_items: int):
+        """Split the texts into (start, end) ranges, a text longer than 'max_batch_tokens' is a batch of its own"""
+        max_tokens = self.rag_params.get("max_batch_tokens")
+        tokenizer = get_tokenizer(self.embedding_model) if max_tokens else None
 
-    def encode(self, texts: List[str], batch_size: int=16):
-        """Compute text embeddings, compatible with various methods"""
-        embeddings = []
-        for i in range(0, len(texts), batch_size):
-            batch_texts = texts[i:i + batch_size]
+        batches = []
+        start = 0
+        tokens = 0
+        for i, text in enumerate(texts):
+            count = tokenizer.count(text) if tokenizer is not None else 0
+            if i > start and (i - start >= max_items or (tokenizer is not None and tokens + count > max_tokens)):
+                batches.append((start, i))
+                start = i
+                tokens = 0
+            tokens += count
+        if start < len(texts):
+            batches.append((start, len(texts)))
+        return batches
+
+    def encode_batch(self, batch_texts: List[str]):
+        """Compute the embeddings of one batch, retried on failure"""
+        def encode():
             if self.rag_provider == "local":
                 # Use SentenceTransformer to get batch embeddings
-                batch_embeddings = self.client.encode(batch_texts, show_progress_bar=True)
+                return self.client.encode(batch_texts, show_progress_bar=True)
             elif self.rag_provider == "openai":
                 # Use OpenAI API to get batch embeddings
                 response = self.client.embeddings.create(
                     input=batch_texts,
                     model=self.embedding_model
                 )
-                batch_embeddings = [item.embedding for item in response.data]
+                return [item.embedding for item in response.data]
             elif self.rag_provider == "ollama":
                 # Use Ollama API to get batch embeddings
-                batch_embeddings = self.client.embed(self.embedding_model, batch_texts)["embeddings"]
+                return self.client.embed(self.embedding_model, batch_texts)["embeddings"]
             else:
                 raise ValueError(f"Unsupported embedding method: {self.rag_provider}")
-            embeddings.extend(batch_embeddings)
-        embeddings = np.array(embeddings, dtype="float32")
 
-        return embeddings
+        return self.retry_policy.run_sync(encode)
+
+
+class RAGSimple(Embedder, RAGBase):
+    def __init__(self, rag_settings: dict, rag_provider: str, kb_path: str=None, embedding_cache=None,
+                 vector_store: str=None):
+        """
+        Initialize custom RAG module
+        :param embedding_cache: EmbeddingCache consulted before the provider, 'cache_settings["embeddings"]' by default.
+        :param vector_store: 'chromadb' or 'numpy', by default the store found at 'kb_path', otherwise 'vector_store_settings["backend"]'.
+        """
+        RAGBase.__init__(self)
+        Embedder.__init__(self, rag_settings, rag_provider, embedding_cache)
+        self.collections = {}
+
+        # LRU of the query embeddings
+        settings = cache_settings.get("embeddings", {})
+        self.query_cache = OrderedDict()
+        self.query_cache_items = settings.get("query_cache_items", 1024)
+        self.query_cache_lock = threading.Lock()
+
+        self.kb_client = None
+        self.vector_store = vector_store
+        self.init_kb(kb_path)
+
+    def init_kb(self, kb_path: str=None):
+        """Initialize knowledge base"""
+        vector_store = self.vector_store
+        if vector_store is None:
+            vector_store = "numpy" if NumpyVectorStore.exists(kb_path) else vector_store_settings.get("backend", "chromadb")
+
+        if vector_store == "numpy":
+            self.kb_client = NumpyVectorStore(
+                kb_path, vector_store_settings.get("dtype", "float32"), vector_store_settings.get("read_only", False)
+            )
+        elif vector_store == "chromadb":
+            import chromadb
+
+            if kb_path is None:
+                self.kb_client = chromadb.Client()
+            else:
+                self.kb_client = chromadb.PersistentClient(path=kb_path)
+        else:
+            raise ValueError(f"Unsupported vector store: {vector_store}")
+        # Manifests of the ingested files, stored next to the vector database
+        self.manifests = ManifestStore(os.path.join(kb_path, "manifests") if kb_path is not None else None)
 
     def search(self, query_texts: list[str], kb_name: str="default", top_k: int=4):
         """Retrieve the most relevant document content based on the query"""
-        if self.collections.get(kb_name) is None:
-            self.collections[kb_name] = self.kb_client.get_or_create_collection(name=kb_name)
-
-        results = self.collections[kb_name].query(
-            query_embeddings=self.encode(query_texts),
+        results = self.get_collection(kb_name).query(
+            query_embeddings=self.encode_queries(query_texts),
             query_texts=query_texts,
             n_results=top_k
         )
         return results
 
+    def encode_queries(self, query_texts: List[str]):
+        """Compute the query embeddings, repeated queries are served from the LRU"""
+        embeddings = [None] * len(query_texts)
+        with self.query_cache_lock:
+            for i, text in enumerate(query_texts):
+                embedding = self.query_cache.get(text)
+                if embedding is not None:
+                    self.query_cache.move_to_end(text)
+                    embeddings[i] = embedding
+
+        missing = list(dict.fromkeys(text for text, embedding in zip(query_texts, embeddings) if embedding is None))
+        if missing:
+            new_embeddings = dict(zip(missing, self.encode(missing)))
+            with self.query_cache_lock:
+                for text, embedding in new_embeddings.items():
+                    self.query_cache[text] = embedding
+                while len(self.query_cache) > self.query_cache_items:
+                    self.query_cache.popitem(last=False)
+            embeddings = [new_embeddings[text] if embedding is None else embedding for text, embedding in zip(query_texts, embeddings)]
+
+        return np.array(embeddings, dtype="float32")
+
     def kb_exists(self, kb_name: str="default"):
         """Check if the knowledge base exists"""
         try:
@@ -147,32 +269,140 @@ class RAGSimple(RAGBase):
             print("'PyMuPDF' needs to be installed to read PDF files.")
         return text
 
-    def add_texts(self, texts: List[str], metadatas: list[dict]=None, kb_name: str="default"):
+    def get_collection(self, kb_name: str="default"):
         if self.collections.get(kb_name) is None:
             self.collections[kb_name] = self.kb_client.get_or_create_collection(name=kb_name)
+        return self.collections[kb_name]
 
-        count = self.collections[kb_name].count()
-        ids = [f"{i}" for i in range(count, count+len(texts))]
-        self.collections[kb_name].add(
-            embeddings=self.encode(texts),
-            documents=texts,
-            metadatas=metadatas,
-            ids=ids
-        )
+    def add_texts(self, texts: List[str], metadatas: list[dict]=None, kb_name: str="default", ids: List[str]=None):
+        """
+        Upsert texts, only the IDs not in the knowledge base yet are embedded.
+        :param ids: IDs of the texts, derived from the content and the 'source' metadata by default.
+        :return: Number of added texts.
+        """
+        collection = self.get_collection(kb_name)
+
+        if ids is None:
+            sources = [(metadata or {}).get("source", "") for metadata in metadatas] if metadatas else [""] * len(texts)
+            ids = [None] * len(texts)
+            for source in dict.fromkeys(sources):
+                indices = [i for i, s in enumerate(sources) if s == source]
+                for i, chunk_id in zip(indices, chunk_ids(source, [texts[i] for i in indices])):
+                    ids[i] = chunk_id
+
+        # Unchanged texts keep their IDs, they are neither embedded nor written again
+        existing = set()
+        for i in range(0, len(ids), __UPSERT_BATCH_SIZE__):
+            existing.update(collection.get(ids=ids[i:i + __UPSERT_BATCH_SIZE__], include=[])["ids"])
+        new = [i for i, chunk_id in enumerate(ids) if chunk_id not in existing]
+
+        for i in range(0, len(new), __UPSERT_BATCH_SIZE__):
+            batch = new[i:i + __UPSERT_BATCH_SIZE__]
+            collection.upsert(
+                embeddings=self.encode([texts[j] for j in batch]),
+                documents=[texts[j] for j in batch],
+                metadatas=[metadatas[j] for j in batch] if metadatas else None,
+                ids=[ids[j] for j in batch]
+            )
+        return len(new)
+
+    def delete_ids(self, ids: List[str], kb_name: str="default"):
+        collection = self.get_collection(kb_name)
+        for i in range(0, len(ids), __UPSERT_BATCH_SIZE__):
+            collection.delete(ids=ids[i:i + __UPSERT_BATCH_SIZE__])
+
+    def add_documents(self, document_paths: List[str], chunk_size: int=500, kb_name: str="default", prune: bool=True):
+        """
+        Load documents and build vector database.
+        Ingestion is incremental: unchanged files are skipped, the chunks of changed files are upserted and
+        their previous chunks deleted. The fingerprint and chunk IDs of each file are kept in its manifest.
+        Large corpora are built faster by the parallel pipeline of pipeline.py.
+        :param prune: Delete the chunks of the ingested files that no longer exist.
+        :return: Numbers of added and deleted chunks, of updated and unchanged files.
+        """
+        stats = {"added": 0, "deleted": 0, "updated": 0, "unchanged": 0}
+        chunker = chunkerify(lambda text: len(text), chunk_size)
 
-    def add_documents(self, document_paths: List[str], chunk_size: int=500, kb_name: str="default"):
-        """Load documents and build vector database"""
-        texts = []
         for doc_path in document_paths:
-            if doc_path.endswith(".txt"):
-                with open(doc_path, "r", encoding="utf-8") as f:
-                    text = f.read()
-            elif doc_path.endswith(".pdf"):
-                text = self.read_pdf(doc_path)
-            else:
+            if not doc_path.endswith(__DOCUMENT_EXTENSIONS__):
                 print(f"Unsupported file format: {doc_path}")
-                return
-            chunker = chunkerify(lambda text: len(text), chunk_size)
-            texts.extend(chunker(text, progress=True))
-            metadatas = [{"source": doc_path} for _ in range(len(texts))]
-            self.add_texts(texts, metadatas, kb_name)
+                continue
+
+            manifest = self.check_document(doc_path, chunk_size, kb_name)
+            if manifest is None:
+                stats["unchanged"] += 1
+                continue
+
+            texts = chunker(self.read_document(doc_path))
+            ids = chunk_ids(doc_path, texts)
+            stats["added"] += self.add_texts(texts, [{"source": doc_path} for _ in texts], kb_name, ids)
+            stats["deleted"] += self.commit_document(manifest, ids, kb_name)
+            stats["updated"] += 1
+
+        if prune:
+            stats["deleted"] += self.prune_documents(kb_name)
+        self.manifests.save(kb_name)
+
+        return stats
+
+    def check_document(self, doc_path: str, chunk_size: int, kb_name: str="default"):
+        """
+        Compare a document with its manifest, its size and mtime are checked before its content.
+        :return: The new manifest of the document (without 'ids'), None if the document is unchanged.
+        """
+        # Files are identified by their absolute path
+        key = os.path.abspath(doc_path)
+        file_stat = os.stat(doc_path)
+        manifest = self.manifests.get(kb_name).get(key)
+        new_manifest = {
+            "source": doc_path, "hash": None, "size": file_stat.st_size, "mtime": file_stat.st_mtime_ns,
+            "chunk_size": chunk_size,
+        }
+        if manifest is not None and manifest["chunk_size"] == chunk_size:
+            if manifest["size"] == file_stat.st_size and manifest["mtime"] == file_stat.st_mtime_ns:
+                return None
+            new_manifest["hash"] = file_hash(doc_path)
+            if manifest["hash"] == new_manifest["hash"]:
+                # Touched but unchanged
+                self.manifests.set(kb_name, key, dict(manifest, size=file_stat.st_size, mtime=file_stat.st_mtime_ns))
+                return None
+        else:
+            new_manifest["hash"] = file_hash(doc_path)
+        return new_manifest
+
+    def read_document(self, doc_path: str):
+        if doc_path.endswith(".pdf"):
+            return self.read_pdf(doc_path)
+        with open(doc_path, "r", encoding="utf-8") as f:
+            return f.read()
+
+    def commit_document(self, manifest: dict, ids: List[str], kb_name: str="default", save: bool=True):
+        """Record the manifest of a document once its chunks are written, return the number of deleted stale chunks"""
+        key = os.path.abspath(manifest["source"])
+        previous = self.manifests.get(kb_name).get(key)
+        stale = []
+        if previous is not None:
+            current = set(ids)
+            stale = [chunk_id for chunk_id in previous["ids"] if chunk_id not in current]
+            self.delete_ids(stale, kb_name)
+
+        self.manifests.set(kb_name, key, dict(manifest, ids=ids))
+        if save:
+            self.manifests.save(kb_name)
+        return len(stale)
+
+    def prune_documents(self, kb_name: str="default"):
+        """Delete the chunks of the ingested files that no longer exist, return the number of deleted chunks"""
+        removed = [key for key in self.manifests.keys(kb_name) if not os.path.exists(key)]
+        return self.remove_documents(removed, kb_name) if removed else 0
+
+    def remove_documents(self, document_paths: List[str], kb_name: str="default"):
+        """Delete the chunks of the documents, return the number of deleted chunks"""
+        deleted = 0
+        for doc_path in document_paths:
+            manifest = self.manifests.remove(kb_name, os.path.abspath(doc_path))
+            if manifest is not None:
+                self.delete_ids(manifest["ids"], kb_name)
+                deleted += len(manifest["ids"])
+        self.manifests.save(kb_name)
+        return deleted
@@ -11,10 +11,6 @@ from functools import cache
 from itertools import accumulate
 from contextlib import suppress
 
-import mpire
-
-from tqdm import tqdm
-
 if TYPE_CHECKING:
     import tiktoken
     import tokenizers
@@ -174,6 +170,7 @@ class Chunker:
         text_or_texts: str | Sequence[str],
         processes: int = 1,
         progress: bool = False,
+        pool = None,
     ) -> list[str] | list[list[str]]:
         """Split text or texts into semantically meaningful chunks of a specified size as determined by the provided tokenizer or token counter.
         
@@ -183,16 +180,22 @@ class Chunker:
         Returns:
             list[str] | list[list[str]]: If a single text has been provided, a list of chunks up to `chunk_size`-tokens-long, with any whitespace used to split the text removed, or, if multiple texts have been provided, a list of lists of chunks, with each inner list corresponding to the chunks of one of the provided input texts.
             processes (int, optional): The number of processes to use when chunking multiple texts. Defaults to `1` in which case chunking will occur in the main process.
-            progress (bool, optional): Whether to display a progress bar when chunking multiple texts. Defaults to `False`."""
+            progress (bool, optional): Whether to display a progress bar when chunking multiple texts. Defaults to `False`.
+            pool (mpire.WorkerPool, optional): A pool created with `keep_alive = True` that is reused across calls instead of starting `processes` new processes on each call. Defaults to `None`."""
         if isinstance(text_or_texts, str):
             return self.chunk(text_or_texts)
         
+        if pool is not None:
+            return pool.map(self.chunk, text_or_texts, progress_bar = progress)
+        
         if progress and processes == 1:
+            from tqdm import tqdm
             text_or_texts = tqdm(text_or_texts)
         
         if processes == 1:
             return [self.chunk(text) for text in text_or_texts]
         
+        import mpire
         with mpire.WorkerPool(processes, use_dill = True) as pool:
             return pool.map(self.chunk, text_or_texts, progress_bar = progress)
 
@@ -0,0 +1,387 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+
+import numpy as np
+
+# Marker file of a numpy vector store directory
+__STORE_FILE__ = "numpy_store.json"
+# Number of rows scored at once by a query, bounds the memory used by float16 matrices converted to float32
+__QUERY_BLOCK_ROWS__ = 65536
+# Deleted rows are compacted away once they are more than this fraction of the rows
+__COMPACT_RATIO__ = 0.5
+
+
+class NumpyCollection:
+    def __init__(self, path: str, dtype: str="float32", read_only: bool=False):
+        """
+        Collection of a NumpyVectorStore, it implements the part of the chromadb collection API used by RAGSimple.
+        Files of generation N (a compaction starts a new generation):
+        - 'vectors.N.<dtype>': contiguous matrix of the normalized embeddings, one row per record.
+        - 'records.N.jsonl': id, document and metadata of each row, 'offsets.N.i64' holds their (offset, length).
+        - 'ids.N.txt': id of each row, only read by writers to find the rows of upserted and deleted ids.
+        - 'deleted.N.u8': 1 for the rows deleted or replaced by an upsert.
+        'collection.json' holds the generation, the number of rows and the dimension, it is replaced after each write,
+        so that readers never see partial rows.
+        :param read_only: Map the files read-only, several processes then share the same pages.
+        """
+        self.path = path
+        self.read_only = read_only
+        self.lock = threading.RLock()
+
+        info_path = os.path.join(path, "collection.json")
+        if os.path.exists(info_path):
+            with open(info_path, "r", encoding="utf-8") as f:
+                self.info = json.load(f)
+        else:
+            # A read-only collection that does not exist yet is empty, its files are created by the first writer
+            self.info = {"generation": 0, "rows": 0, "dim": None, "dtype": np.dtype(dtype).name}
+            if not read_only:
+                os.makedirs(path, exist_ok=True)
+                self.save_info()
+        self.dtype = np.dtype(self.info["dtype"])
+        self.load()
+
+    def file_path(self, name: str, generation: int=None):
+        generation = self.info["generation"] if generation is None else generation
+        return os.path.join(self.path, name.replace("*", str(generation)))
+
+    def save_info(self):
+        temp_path = os.path.join(self.path, "collection.json.tmp")
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(self.info, f)
+        os.replace(temp_path, os.path.join(self.path, "collection.json"))
+
+    def load(self, id_rows: dict=None):
+        """
+        Map the files, writers first drop the rows of an interrupted write.
+        :param id_rows: Row of each id when known by the caller, otherwise they are read again on the next write.
+        """
+        rows, dim = self.info["rows"], self.info["dim"]
+        sizes = {
+            f"vectors.*.{self.dtype.name}": rows * (dim or 0) * self.dtype.itemsize,
+            "offsets.*.i64": rows * 16,
+            "deleted.*.u8": rows,
+        }
+        if not self.read_only:
+            for name, size in sizes.items():
+                with open(self.file_path(name), "ab") as f:
+                    f.truncate(size)
+            # The records end after the last row, the tail of 'ids.*.txt' is dropped by 'load_ids()'
+            records_size = 0
+            if rows:
+                offset, length = np.fromfile(self.file_path("offsets.*.i64"), dtype=np.int64, count=2, offset=(rows - 1) * 16)
+                records_size = int(offset + length + 1)
+            with open(self.file_path("records.*.jsonl"), "ab") as f:
+                f.truncate(records_size)
+
+        self.vectors = self.map(f"vectors.*.{self.dtype.name}", self.dtype, (rows, dim or 0))
+        self.offsets = self.map("offsets.*.i64", np.int64, (rows, 2))
+        self.records = self.map("records.*.jsonl", np.uint8, None)
+        self.deleted = np.fromfile(self.file_path("deleted.*.u8"), dtype=np.uint8, count=rows).astype(bool) \
+            if rows else np.zeros(0, dtype=bool)
+        self.live = int(rows - self.deleted.sum())
+        # Row of each id, loaded on the first write
+        self.id_rows = id_rows
+
+    def map(self, name: str, dtype, shape):
+        path = self.file_path(name)
+        if not os.path.exists(path) or os.path.getsize(path) == 0 or (shape is not None and shape[0] == 0):
+            return np.zeros(shape if shape is not None else 0, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode="r", shape=shape)
+
+    def load_ids(self):
+        if self.id_rows is None:
+            self.id_rows = {}
+            rows = self.info["rows"]
+            ids_path = self.file_path("ids.*.txt")
+            size = 0
+            replaced = []
+            if rows:
+                with open(ids_path, "rb") as f:
+                    for row, line in enumerate(f):
+                        if row >= rows:
+                            break
+                        size += len(line)
+                        if not self.deleted[row]:
+                            chunk_id = line.decode("utf-8").rstrip("\n")
+                            if chunk_id in self.id_rows:
+                                # An upsert interrupted before deleting the previous row of the id
+                                replaced.append(self.id_rows[chunk_id])
+                            self.id_rows[chunk_id] = row
+            if not self.read_only:
+                # Ids of an interrupted write are dropped, so that the next rows stay aligned
+                with open(ids_path, "ab") as f:
+                    f.truncate(size)
+                self.mark_deleted(replaced)
+        return self.id_rows
+
+    def record(self, row: int, offsets=None, records=None):
+        offsets = self.offsets if offsets is None else offsets
+        records = self.records if records is None else records
+        offset, length = offsets[row]
+        return json.loads(bytes(records[offset:offset + length]))
+
+    def count(self):
+        return self.live
+
+    def get(self, ids: list=None, include: list=("documents", "metadatas")):
+        """Get the records of the ids, unknown ids are skipped"""
+        with self.lock:
+            id_rows = self.load_ids()
+            if not include:
+                # Only the ids, e.g. to find the chunks already in the collection
+                found = [i for i in ids if i in id_rows] if ids is not None else sorted(id_rows, key=id_rows.get)
+                return {"ids": found, "documents": None, "metadatas": None}
+            rows = [id_rows[i] for i in ids if i in id_rows] if ids is not None else sorted(id_rows.values())
+            records = [self.record(row) for row in rows]
+        return {
+            "ids": [record["id"] for record in records],
+            "documents": [record["document"] for record in records] if "documents" in include else None,
+            "metadatas": [record["metadata"] for record in records] if "metadatas" in include else None,
+        }
+
+    def upsert(self, ids: list, embeddings, documents: list=None, metadatas: list=None):
+        if self.read_only:
+            raise Exception("The vector store is read-only")
+        embeddings = np.asarray(embeddings, dtype="float32")
+        if len(ids) == 0:
+            return
+        if embeddings.ndim != 2 or len(embeddings) != len(ids):
+            raise ValueError("One embedding is required per id")
+        embeddings = embeddings / np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+
+        with self.lock:
+            if self.info["dim"] is None:
+                self.info["dim"] = int(embeddings.shape[1])
+            elif self.info["dim"] != embeddings.shape[1]:
+                raise ValueError(f"Embedding dimension {embeddings.shape[1]} does not match the collection dimension {self.info['dim']}")
+
+            # Upserted ids replace their previous rows, the last one wins within the call
+            id_rows = self.load_ids()
+            last = {chunk_id: i for i, chunk_id in enumerate(ids)}
+            indices = sorted(last.values())
+            replaced = [id_rows[ids[i]] for i in indices if ids[i] in id_rows]
+
+            start = self.info["rows"]
+            records = [
+                json.dumps({
+                    "id": ids[i],
+                    "document": documents[i] if documents is not None else None,
+                    "metadata": metadatas[i] if metadatas is not None else None,
+                }, ensure_ascii=False).encode("utf-8")
+                for i in indices
+            ]
+            records_path = self.file_path("records.*.jsonl")
+            offset = os.path.getsize(records_path) if os.path.exists(records_path) else 0
+            offsets = np.zeros((len(records), 2), dtype=np.int64)
+            for i, record in enumerate(records):
+                offsets[i] = (offset, len(record))
+                offset += len(record) + 1
+
+            # The new rows are committed before the previous rows of their ids are deleted,
+            # so that an interrupted upsert never loses a record
+            try:
+                with open(self.file_path(f"vectors.*.{self.dtype.name}"), "ab") as f:
+                    f.write(embeddings[indices].astype(self.dtype).tobytes())
+                with open(records_path, "ab") as f:
+                    f.write(b"".join(record + b"\n" for record in records))
+                with open(self.file_path("offsets.*.i64"), "ab") as f:
+                    f.write(offsets.tobytes())
+                with open(self.file_path("ids.*.txt"), "a", encoding="utf-8") as f:
+                    f.write("".join(f"{ids[i]}\n" for i in indices))
+                with open(self.file_path("deleted.*.u8"), "ab") as f:
+                    f.write(bytes(len(indices)))
+
+                self.info["rows"] = start + len(indices)
+                self.save_info()
+            except BaseException:
+                # Drop the partial rows before the next write
+                self.refresh()
+                raise
+            for row, i in enumerate(indices, start):
+                id_rows[ids[i]] = row
+            self.load(id_rows)
+            self.mark_deleted(replaced)
+
+    def add(self, ids: list, embeddings, documents: list=None, metadatas: list=None):
+        self.upsert(ids, embeddings, documents, metadatas)
+
+    def delete(self, ids: list):
+        if self.read_only:
+            raise Exception("The vector store is read-only")
+        with self.lock:
+            id_rows = self.load_ids()
+            rows = [id_rows.pop(i) for i in ids if i in id_rows]
+            if not rows:
+                return
+            self.mark_deleted(rows)
+            if self.info["rows"] - self.live > __COMPACT_RATIO__ * self.info["rows"]:
+                self.compact()
+
+    def mark_deleted(self, rows: list):
+        if not rows:
+            return
+        with open(self.file_path("deleted.*.u8"), "r+b") as f:
+            for row in rows:
+                f.seek(row)
+                f.write(b"\x01")
+        self.deleted[rows] = True
+        self.live = int(self.info["rows"] - self.deleted.sum())
+
+    def compact(self):
+        """Rewrite the live rows into the files of a new generation, readers keep their mapping of the previous one"""
+        with self.lock:
+            generation = self.info["generation"] + 1
+            id_rows = self.load_ids()
+            rows = np.array(sorted(id_rows.values()), dtype=np.int64)
+            ids = sorted(id_rows, key=id_rows.get)
+
+            with open(self.file_path(f"vectors.*.{self.dtype.name}", generation), "wb") as f:
+                for i in range(0, len(rows), __QUERY_BLOCK_ROWS__):
+                    f.write(np.ascontiguousarray(self.vectors[rows[i:i + __QUERY_BLOCK_ROWS__]]).tobytes())
+            offsets = np.zeros((len(rows), 2), dtype=np.int64)
+            with open(self.file_path("records.*.jsonl", generation), "wb") as f:
+                offset = 0
+                for i, row in enumerate(rows):
+                    start, length = self.offsets[row]
+                    f.write(bytes(self.records[start:start + length]) + b"\n")
+                    offsets[i] = (offset, length)
+                    offset += length + 1
+            offsets.tofile(self.file_path("offsets.*.i64", generation))
+            with open(self.file_path("ids.*.txt", generation), "w", encoding="utf-8") as f:
+                f.write("".join(f"{i}\n" for i in ids))
+            np.zeros(len(rows), dtype=np.uint8).tofile(self.file_path("deleted.*.u8", generation))
+
+            previous = self.info["generation"]
+            self.info.update(generation=generation, rows=len(rows))
+            if len(rows) == 0:
+                self.info["dim"] = None
+            self.save_info()
+            for name in (f"vectors.*.{self.dtype.name}", "records.*.jsonl", "offsets.*.i64", "ids.*.txt", "deleted.*.u8"):
+                path = self.file_path(name, previous)
+                try:
+                    os.remove(path)
+                except OSError:
+                    # Missing, or still mapped on Windows
+                    pass
+            self.load({i: row for row, i in enumerate(ids)})
+
+    def refresh(self):
+        """Map the rows written by other processes since the collection was opened"""
+        with self.lock:
+            info_path = os.path.join(self.path, "collection.json")
+            if not os.path.exists(info_path):
+                return
+            with open(info_path, "r", encoding="utf-8") as f:
+                self.info = json.load(f)
+            self.load()
+
+    def query(self, query_embeddings, n_results: int=10, query_texts: list=None, include: list=None):
+        """
+        Exact top-k search by cosine similarity, the matrix is scored block by block.
+        :param query_texts: Ignored, the query embeddings are required.
+        :return: Results in the format of chromadb, 'distances' are cosine distances.
+        """
+        queries = np.atleast_2d(np.asarray(query_embeddings, dtype="float32"))
+        queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        num_queries = len(queries)
+
+        # Queries score a snapshot of the mappings, writes and other queries are not blocked
+        with self.lock:
+            vectors, deleted, offsets, records = self.vectors, self.deleted, self.offsets, self.records
+
+        best_scores = np.full((num_queries, 0), -np.inf, dtype="float32")
+        best_rows = np.zeros((num_queries, 0), dtype=np.int64)
+        for start in range(0, len(vectors), __QUERY_BLOCK_ROWS__):
+            block = np.asarray(vectors[start:start + __QUERY_BLOCK_ROWS__], dtype="float32")
+            scores = block @ queries.T
+            scores[deleted[start:start + len(block)]] = -np.inf
+
+            # Top-k of the block, merged with the top-k of the previous blocks
+            k = min(n_results, len(block))
+            if k <= 0:
+                continue
+            top = np.argpartition(-scores, k - 1, axis=0)[:k]
+            scores = np.concatenate([best_scores, np.take_along_axis(scores, top, axis=0).T], axis=1)
+            rows = np.concatenate([best_rows, top.T + start], axis=1)
+            k = min(n_results, scores.shape[1])
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            best_scores = np.take_along_axis(scores, top, axis=1)
+            best_rows = np.take_along_axis(rows, top, axis=1)
+
+        results = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        for scores, rows in zip(best_scores, best_rows):
+            order = np.argsort(-scores)
+            found = [(self.record(rows[i], offsets, records), float(scores[i])) for i in order if scores[i] != -np.inf]
+            results["ids"].append([record["id"] for record, _ in found])
+            results["documents"].append([record["document"] for record, _ in found])
+            results["metadatas"].append([record["metadata"] for record, _ in found])
+            results["distances"].append([1.0 - score for _, score in found])
+        return results
+
+
+class NumpyVectorStore:
+    def __init__(self, path: str=None, dtype: str="float32", read_only: bool=False):
+        """
+        Vector store keeping the embeddings of each collection in a memory-mapped matrix, an alternative to
+        chromadb without its import and open costs. It implements the part of the chromadb client API used by RAGSimple.
+        Worker processes opening the same store with 'read_only=True' share one copy of the matrix in the page cache.
+        :param path: Directory of the store, a temporary directory by default.
+        :param dtype: Type of the new collections, 'float16' halves the size of the matrices.
+        :param read_only: Open the collections read-only.
+        """
+        if path is None:
+            path = tempfile.mkdtemp(prefix="swarm_flow_kb_")
+        self.path = path
+        self.read_only = read_only
+        self.collections = {}
+        self.lock = threading.Lock()
+
+        store_path = os.path.join(path, __STORE_FILE__)
+        if os.path.exists(store_path):
+            with open(store_path, "r", encoding="utf-8") as f:
+                self.dtype = json.load(f)["dtype"]
+        elif read_only:
+            raise ValueError(f"No vector store at '{path}'")
+        else:
+            os.makedirs(path, exist_ok=True)
+            self.dtype = np.dtype(dtype).name
+            with open(store_path, "w", encoding="utf-8") as f:
+                json.dump({"dtype": self.dtype}, f)
+
+    @staticmethod
+    def exists(path: str):
+        return path is not None and os.path.exists(os.path.join(path, __STORE_FILE__))
+
+    def collection_path(self, name: str):
+        return os.path.join(self.path, "collections", name)
+
+    def get_collection(self, name: str):
+        with self.lock:
+            collection = self.collections.get(name)
+            if collection is None:
+                if not os.path.exists(os.path.join(self.collection_path(name), "collection.json")):
+                    raise ValueError(f"Collection {name} does not exist")
+                collection = NumpyCollection(self.collection_path(name), self.dtype, self.read_only)
+                self.collections[name] = collection
+        return collection
+
+    def get_or_create_collection(self, name: str):
+        with self.lock:
+            collection = self.collections.get(name)
+            if collection is None:
+                collection = NumpyCollection(self.collection_path(name), self.dtype, self.read_only)
+                self.collections[name] = collection
+        return collection
+
+    def delete_collection(self, name: str):
+        with self.lock:
+            self.collections.pop(name, None)
+            shutil.rmtree(self.collection_path(name), ignore_errors=True)
+
+    def list_collections(self):
+        path = os.path.join(self.path, "collections")
+        return sorted(os.listdir(path)) if os.path.exists(path) else []
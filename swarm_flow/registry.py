@@ -0,0 +1,142 @@
+import asyncio
+import importlib
+import inspect
+import threading
+import weakref
+
+# Built-in tools of 'swarm_flow/tools.py' and the time to live of their cached results (None: not cached)
+# The module is only imported when one of them is called
+__BUILTIN_TOOLS__ = {
+    "simple_rag": None,
+    "describe_image": 7 * 24 * 3600,
+    "execute_python_code": None,
+    "date": None,
+    "date_cn": None,
+    "web_content": 24 * 3600,
+    "web_search_ddg": 3600,
+    "web_search_searxng": 3600,
+    "web_search": 3600,
+}
+
+
+class Tool:
+    def __init__(self, name: str, func=None, module: str=None, timeout: float=None, cacheable: bool=True,
+                 max_concurrency: int=None, ttl: float=None):
+        """
+        A callable tool and its metadata.
+        :param name: Name of the tool, as declared in the 'functions' section of the workflow YAML.
+        :param func: The function, sync or 'async def'.
+        :param module: Module defining a function named 'name', imported on the first call when 'func' is not given.
+        :param timeout: Timeout of each call in seconds, 'tool_settings["timeout"]' by default.
+        :param cacheable: Whether identical calls may share their result, False for tools with side effects.
+        :param max_concurrency: Maximum number of concurrent calls, unlimited by default.
+        :param ttl: Time to live in seconds of the results in the tool cache, None to not cache them.
+        """
+        self.name = name
+        self.module = module
+        self.timeout = timeout
+        self.cacheable = cacheable
+        self.max_concurrency = max_concurrency
+        self.ttl = ttl
+        self._func = func
+        self.lock = threading.Lock()
+
+        # Concurrency limits: one semaphore for the threads, one per event loop for the coroutines
+        self.thread_limit = threading.BoundedSemaphore(max_concurrency) if max_concurrency else None
+        self.loop_limits = weakref.WeakKeyDictionary()
+
+    @property
+    def func(self):
+        if self._func is None:
+            with self.lock:
+                if self._func is None:
+                    self._func = getattr(importlib.import_module(self.module), self.name)
+        return self._func
+
+    @property
+    def is_async(self):
+        return inspect.iscoroutinefunction(self.func)
+
+    def call(self, **kwargs):
+        """Call the tool from a thread, coroutine tools run in their own event loop"""
+        if self.thread_limit is None:
+            return self._call(kwargs)
+        with self.thread_limit:
+            return self._call(kwargs)
+
+    def _call(self, kwargs):
+        if self.is_async:
+            return asyncio.run(self.func(**kwargs))
+        return self.func(**kwargs)
+
+    async def acall(self, **kwargs):
+        """Call a coroutine tool from the running event loop"""
+        if not self.max_concurrency:
+            return await self.func(**kwargs)
+        loop = asyncio.get_running_loop()
+        limit = self.loop_limits.get(loop)
+        if limit is None:
+            limit = asyncio.Semaphore(self.max_concurrency)
+            self.loop_limits[loop] = limit
+        async with limit:
+            return await self.func(**kwargs)
+
+
+class ToolRegistry:
+    def __init__(self):
+        """Tools callable by the agents, by name"""
+        self.tools = {}
+        self.lock = threading.Lock()
+
+    def register(self, name=None, func=None, **metadata):
+        """
+        Register a tool, also usable as a decorator:
+            @tool_registry.register(timeout=10)
+            async def fetch_weather(city: str) -> str: ...
+        :param name: Name of the tool, the function name by default.
+        :param func: The function, sync or 'async def'.
+        :param metadata: 'module', 'timeout', 'cacheable', 'max_concurrency' and 'ttl', see Tool.
+        """
+        if callable(name):
+            name, func = None, name
+
+        def decorator(func):
+            self.add(Tool(name or func.__name__, func, **metadata))
+            return func
+
+        if func is None and "module" in metadata:
+            self.add(Tool(name, **metadata))
+            return None
+        if func is None:
+            return decorator
+        return decorator(func)
+
+    def add(self, tool: Tool):
+        with self.lock:
+            self.tools[tool.name] = tool
+
+    def unregister(self, name: str):
+        with self.lock:
+            self.tools.pop(name, None)
+
+    def get(self, name: str):
+        return self.tools.get(name)
+
+    def __contains__(self, name: str):
+        return name in self.tools
+
+    def names(self):
+        return list(self.tools)
+
+
+# Process-wide registry used by default
+tool_registry = ToolRegistry()
+for tool_name, tool_ttl in __BUILTIN_TOOLS__.items():
+    tool_registry.register(tool_name, module=f"{__package__}.tools", ttl=tool_ttl)
+# Running code has side effects, identical calls must not share their result
+tool_registry.get("execute_python_code").cacheable = False
+
+
+def register_tool(name=None, func=None, **metadata):
+    """Register a tool in the process-wide registry, see ToolRegistry.register()"""
+    return tool_registry.register(name, func, **metadata)
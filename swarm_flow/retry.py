@@ -0,0 +1,99 @@
+import asyncio
+import random
+import time
+
+# Errors that fail again with the same request, they are not retried unless listed in 'retry_on'
+__NON_RETRYABLE_ERRORS__ = (
+    "BadRequestError",
+    "AuthenticationError",
+    "PermissionDeniedError",
+    "NotFoundError",
+    "UnprocessableEntityError",
+    "ContextOverflowError",
+)
+
+
+class RetryPolicy:
+    def __init__(self, max_attempts: int=1, backoff: float=1.0, multiplier: float=2.0, max_backoff: float=30.0,
+                 jitter: float=0.5, retry_on: list=None):
+        """
+        Retry policy of a step or a 'for_each' item.
+        :param max_attempts: Maximum number of attempts, 1 disables retries.
+        :param backoff: Delay before the first retry in seconds.
+        :param multiplier: The delay is multiplied by this factor after each attempt.
+        :param max_backoff: Maximum delay in seconds.
+        :param jitter: Random fraction (0~1) removed from each delay, so that concurrent retries are spread out.
+        :param retry_on: Names of the retryable exception classes (subclasses included), all errors except invalid requests by default.
+        """
+        self.max_attempts = max(1, int(max_attempts))
+        self.backoff = backoff
+        self.multiplier = multiplier
+        self.max_backoff = max_backoff
+        self.jitter = min(max(jitter, 0.0), 1.0)
+        self.retry_on = retry_on
+
+    @classmethod
+    def from_config(cls, config, default=None):
+        """
+        Create a policy from the 'retry' setting of the workflow YAML, e.g.
+        retry:
+          max_attempts: 3
+          backoff: 1
+          retry_on: [APITimeoutError, RateLimitError]
+        An integer is a shortcut for 'max_attempts'. Missing fields come from the default policy.
+        """
+        if config is None:
+            return default if default is not None else cls()
+        if isinstance(config, int):
+            config = {"max_attempts": config}
+
+        params = dict(default.__dict__) if default is not None else {}
+        params.update(config)
+        return cls(**params)
+
+    def is_retryable(self, error: BaseException):
+        if not isinstance(error, Exception):
+            return False
+        names = [c.__name__ for c in type(error).__mro__]
+        if self.retry_on is not None:
+            return any(name in self.retry_on for name in names)
+        return not any(name in __NON_RETRYABLE_ERRORS__ for name in names)
+
+    def delay(self, attempt: int):
+        """Delay before the next attempt, 'attempt' is the number of failed attempts"""
+        delay = min(self.max_backoff, self.backoff * self.multiplier ** (attempt - 1))
+        return delay * (1.0 - self.jitter * random.random())
+
+    def run_sync(self, func, on_retry=None):
+        """Same as 'run()' for a blocking function, the delays block the calling thread"""
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                return func()
+            except Exception as e:
+                if attempt >= self.max_attempts or not self.is_retryable(e):
+                    raise
+                delay = self.delay(attempt)
+                if on_retry is not None:
+                    on_retry(attempt, e, delay)
+                time.sleep(delay)
+
+    async def run(self, func, on_retry=None):
+        """
+        Await 'func()' until it succeeds, the error is not retryable or the attempts are exhausted.
+        :param func: Coroutine function to execute.
+        :param on_retry: Function called with (attempt, error, delay) before each retry.
+        """
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                return await func()
+            except Exception as e:
+                if attempt >= self.max_attempts or not self.is_retryable(e):
+                    raise
+                delay = self.delay(attempt)
+                if on_retry is not None:
+                    on_retry(attempt, e, delay)
+                await asyncio.sleep(delay)
@@ -0,0 +1,141 @@
+import asyncio
+import heapq
+
+
+class StepGraph:
+    def __init__(self, steps):
+        """
+        Dependency graph of the workflow steps, computed once from the 'prerequisite' fields.
+        :param steps: Workflow steps, already sorted by the 'order' field.
+        """
+        # Position of each step in the 'order' sequence, used to break ties between ready steps
+        self.position = {step["name"]: idx for idx, step in enumerate(steps)}
+        self.execution = {step["name"]: step.get("execution", "sync") for step in steps}
+
+        self.prerequisite = {}
+        self.dependents = {name: [] for name in self.position}
+        for step in steps:
+            step_name = step["name"]
+            prerequisite = list(dict.fromkeys(step.get("prerequisite") or []))
+            for pre in prerequisite:
+                if pre not in self.position:
+                    raise Exception(f"Unable to execute workflow, '{step_name}' depends on an unknown step '{pre}'.")
+                self.dependents[pre].append(step_name)
+            self.prerequisite[step_name] = prerequisite
+
+        self.in_degree = {name: len(pre) for name, pre in self.prerequisite.items()}
+        self.roots = [name for name in self.position if self.in_degree[name] == 0]
+        self.topological_order = self.sort()
+
+    def __len__(self):
+        return len(self.position)
+
+    def sort(self):
+        """Kahn's algorithm, rejecting cyclic dependencies before any step is executed"""
+        in_degree = dict(self.in_degree)
+        ready = [(self.position[name], name) for name in self.roots]
+        heapq.heapify(ready)
+
+        order = []
+        while ready:
+            _, step_name = heapq.heappop(ready)
+            order.append(step_name)
+            for dep in self.dependents[step_name]:
+                in_degree[dep] -= 1
+                if in_degree[dep] == 0:
+                    heapq.heappush(ready, (self.position[dep], dep))
+
+        if len(order) < len(self.position):
+            cycle = [name for name in self.position if in_degree[name] > 0]
+            raise Exception(f"Unable to execute workflow, there is a circular dependency between steps: {cycle}")
+
+        return order
+
+
+class StepScheduler:
+    def __init__(self, graph, execute, completed=None):
+        """
+        Event-driven scheduler for one execution of the workflow.
+        :param graph: The StepGraph of the workflow.
+        :param execute: Coroutine function executing a step by name, it must call 'release()' once the step has been completed.
+        :param completed: Steps completed by a previous execution, they are skipped. The set is updated in place.
+        """
+        self.graph = graph
+        self.execute = execute
+
+        # Remaining prerequisites of each step
+        self.in_degree = dict(graph.in_degree)
+        self.completed = set() if completed is None else completed
+        for step_name in self.completed:
+            for dep in graph.dependents[step_name]:
+                self.in_degree[dep] -= 1
+
+        # Sync steps waiting to be executed, ordered by the 'order' field
+        self.ready = []
+        # Running async steps
+        self.running = set()
+
+        self.error = None
+        self.wakeup = asyncio.Event()
+
+    def release(self, step_name):
+        """Mark the step as completed and release its dependents"""
+        if step_name in self.completed:
+            return
+        self.completed.add(step_name)
+
+        for dep in self.graph.dependents[step_name]:
+            self.in_degree[dep] -= 1
+            if self.in_degree[dep] == 0:
+                self.schedule(dep)
+
+        self.wakeup.set()
+
+    def schedule(self, step_name):
+        if self.graph.execution[step_name] == "async":
+            # Asynchronous steps start as soon as their prerequisites are completed
+            task = asyncio.create_task(self.execute(step_name))
+            self.running.add(task)
+            task.add_done_callback(self.on_task_done)
+        else:
+            heapq.heappush(self.ready, (self.graph.position[step_name], step_name))
+
+    def on_task_done(self, task):
+        self.running.discard(task)
+        if not task.cancelled() and task.exception() is not None and self.error is None:
+            self.error = task.exception()
+        self.wakeup.set()
+
+    async def run(self):
+        for step_name in self.graph.topological_order:
+            if self.in_degree[step_name] == 0 and step_name not in self.completed:
+                heapq.heappush(self.ready, (self.graph.position[step_name], step_name))
+
+        try:
+            while len(self.completed) < len(self.graph):
+                if self.error is not None:
+                    raise self.error
+
+                if self.ready:
+                    _, step_name = heapq.heappop(self.ready)
+                    if self.graph.execution[step_name] == "async":
+                        self.schedule(step_name)
+                    else:
+                        # Synchronize execution
+                        await self.execute(step_name)
+                    continue
+
+                if not self.running:
+                    pending = [name for name in self.graph.position if name not in self.completed]
+                    raise Exception(f"Unable to execute workflow, steps {pending} were never released.")
+
+                # Waiting for a running step to complete
+                self.wakeup.clear()
+                await self.wakeup.wait()
+
+            # Steps may have been released before their tasks returned
+            if self.running:
+                await asyncio.gather(*self.running)
+        finally:
+            for task in self.running:
+                task.cancel()
@@ -0,0 +1,66 @@
+import asyncio
+
+
+class Flight:
+    def __init__(self, task):
+        """An in-flight call and the number of callers waiting for it"""
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    def __init__(self):
+        """
+        Deduplicate identical concurrent calls: while a call is in flight, callers with the same key share its result.
+        """
+        self.calls = {}
+
+        # Statistics
+        self.executed = 0
+        self.suppressed = 0
+
+    async def do(self, key, func):
+        """
+        Await 'func()', or the in-flight call with the same key.
+        The call runs in its own task, so that cancelling one caller never cancels the others.
+        It is only cancelled once all its callers are cancelled.
+        :param key: Hashable key identifying identical calls.
+        :param func: Coroutine function executing the call.
+        """
+        # Tasks belong to an event loop, calls are only shared within the same loop
+        loop = asyncio.get_running_loop()
+        flight_key = (id(loop), key)
+
+        flight = self.calls.get(flight_key)
+        if flight is None:
+            flight = Flight(loop.create_task(func()))
+            self.calls[flight_key] = flight
+            self.executed += 1
+            flight.task.add_done_callback(lambda task: self.finish(flight_key, flight))
+        else:
+            self.suppressed += 1
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                # All callers are cancelled, nobody waits for the result
+                self.finish(flight_key, flight)
+                flight.task.cancel()
+
+    def finish(self, flight_key, flight):
+        if self.calls.get(flight_key) is flight:
+            del self.calls[flight_key]
+        # The exception is raised to the callers, avoid the 'never retrieved' warning when they are all cancelled
+        if flight.task.done() and not flight.task.cancelled():
+            flight.task.exception()
+
+    def stats(self):
+        return {"executed": self.executed, "suppressed": self.suppressed, "in_flight": len(self.calls)}
+
+
+# Shared by all Swarm clients of the process, so that concurrent sessions are deduplicated too
+llm_flights = SingleFlight()
+tool_flights = SingleFlight()
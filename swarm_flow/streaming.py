@@ -0,0 +1,53 @@
+import asyncio
+
+
+class StreamChannel:
+    def __init__(self, callback, on_error=None, max_buffered_chunks=256):
+        """
+        Single channel multiplexing the streamed chunks of all concurrent steps.
+        Chunks are delivered to the callback in arrival order by one consumer task.
+        Producers only wait for the callback once 'max_buffered_chunks' chunks are pending.
+        :param callback: Function called with each chunk.
+        :param on_error: Function called with the exception of a failed callback, printed by default.
+        """
+        self.callback = callback
+        self.on_error = on_error
+        self.queue = asyncio.Queue(maxsize=max_buffered_chunks)
+        self.consumer = None
+        self.error = None
+
+    async def send(self, chunk):
+        if self.consumer is None:
+            self.consumer = asyncio.create_task(self.consume())
+        await self.queue.put(chunk)
+
+    async def consume(self):
+        while True:
+            chunk = await self.queue.get()
+            try:
+                if chunk is None:
+                    break
+                if self.error is None:
+                    self.callback(chunk)
+            except Exception as e:
+                # The remaining chunks are dropped, the error is reported by 'aclose()'
+                self.error = e
+            finally:
+                self.queue.task_done()
+
+    async def aclose(self):
+        """
+        Deliver the pending chunks and stop the consumer task.
+        A failed callback is only reported, it never replaces the result of the workflow.
+        """
+        if self.consumer is None:
+            return
+        await self.queue.put(None)
+        await self.consumer
+        self.consumer = None
+        if self.error is not None:
+            error, self.error = self.error, None
+            if self.on_error is not None:
+                self.on_error(error)
+            else:
+                print(f"Stream callback caused an exception: {error}")
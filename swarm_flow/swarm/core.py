@@ -1,15 +1,21 @@
 # Standard library imports
-import copy
+import asyncio
+import concurrent.futures
+import functools
 import json
-from collections import defaultdict
+import threading
+import time
+from collections import ChainMap, defaultdict
 from typing import List
 
 # Package/library imports
-from openai import OpenAI
+from openai import AsyncOpenAI
 
 
 # Local imports
-from .util import debug_print, merge_chunk
+from .util import debug_print, function_tools, merge_chunk
+from ..llm_cache import LLMCache, achunks_from_message, chunks_from_message, completion_from_message, message_from_completion
+from ..tool_cache import ToolCache
 from .types import (
     Agent,
     ChatCompletionMessage,
@@ -19,48 +25,100 @@ from .types import (
     Result,
 )
 
-from ..tools import *
+from ..clients import LoopBoundClient, create_openai_client, get_async_openai_client, get_openai_client
+from ..config import tool_settings
+from ..registry import tool_registry
 
 
 __CTX_VARS_NAME__ = "context_variables"
 __TRANSFER_TO_AGENT__ = "transfer_to_agent"
 
 
+tool_executor = None
+tool_executor_lock = threading.Lock()
+def get_tool_executor():
+    """Get the process-wide pool running the blocking tools"""
+    global tool_executor
+    with tool_executor_lock:
+        if tool_executor is None:
+            tool_executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=tool_settings.get("max_workers", 8), thread_name_prefix="swarm-tool"
+            )
+    return tool_executor
+
+
 class Swarm:
-    def __init__(self, client=None, base_url=None, api_key="", workflow=None):
+    def __init__(self, client=None, base_url=None, api_key="", workflow=None, async_client=None, llm_cache=None,
+                 llm_flights=None, tool_flights=None, tools=None, tool_cache=None, endpoint=None):
         self.workflow = workflow
+        self.llm_cache = llm_cache
+        # ToolCache of the results of the tools with a time to live, None to disable
+        self.tool_cache = tool_cache
+
+        # ToolRegistry resolving the tool calls, the process-wide registry by default
+        self.tools = tools if tools is not None else tool_registry
+
+        # SingleFlight instances deduplicating identical concurrent LLM and tool calls, None to disable
+        self.llm_flights = llm_flights
+        self.tool_flights = tool_flights
+
+        # Timeout of each tool call in seconds, a slow tool returns an error instead of blocking the turn
+        self.tool_timeout = tool_settings.get("timeout")
         if base_url and len(base_url) > 0:
-            self.client = OpenAI(base_url=base_url, api_key=api_key, timeout=300)
+            self.client = self.create_client(base_url, api_key)
         else:
             if not client:
-                client = OpenAI(api_key=api_key)
+                client = self.create_client(base_url, api_key)
             self.client = client
 
-    def get_chat_completion(
+        # An AsyncOpenAI client or a LoopBoundClient, the shared client of the base URL if not provided
+        if async_client is None:
+            if client is None or (base_url and len(base_url) > 0):
+                async_client = get_async_openai_client(base_url, api_key)
+            else:
+                async_client = LoopBoundClient(lambda: AsyncOpenAI(
+                    base_url=self.client.base_url, api_key=self.client.api_key, timeout=self.client.timeout
+                ))
+        self._async_client = async_client
+
+        # Provider and base URL of the clients, part of the LLM cache and single-flight keys
+        if endpoint is None:
+            endpoint = str(getattr(self.client, "base_url", None) or base_url or "")
+        self.endpoint = endpoint
+
+    @staticmethod
+    def create_client(base_url=None, api_key="", use_async=False):
+        """Get the process-wide client of the base URL, async clients are created per event loop"""
+        if use_async:
+            return create_openai_client(base_url, api_key, use_async=True)
+        return get_openai_client(base_url, api_key)
+
+    @property
+    def async_client(self):
+        if isinstance(self._async_client, LoopBoundClient):
+            return self._async_client.get()
+        return self._async_client
+
+    def build_completion_params(
         self,
         agent: Agent,
         history: List,
         model_override: str,
         stream: bool,
         debug: bool,
-    ) -> ChatCompletionMessage:
+    ) -> dict:
         messages = history
         debug_print(debug, "Getting chat completion for:", messages)
 
-        # tools = [function_to_json(f) for f in agent.functions]
-        tools = [{"type": "function", "function": f} for f in agent.functions]
-
-        # hide context_variables from model
-        for tool in tools:
-            params = tool["function"]["parameters"]
-            params["properties"].pop(__CTX_VARS_NAME__, None)
-            if __CTX_VARS_NAME__ in params["required"]:
-                params["required"].remove(__CTX_VARS_NAME__)
+        # The payload is precomputed when the workflow is compiled, context_variables is hidden from model
+        tools = agent.tools
+        if tools is None:
+            tools = function_tools(agent.functions, (__CTX_VARS_NAME__,))
 
         create_params = {
             "model": model_override or agent.model,
             "messages": messages,
-            "tools": tools or None,
+            "tools": list(tools) or None,
             "tool_choice": agent.tool_choice,
             "stream": stream,
         }
@@ -68,7 +126,72 @@ class Swarm:
         if tools:
             create_params["parallel_tool_calls"] = agent.parallel_tool_calls
 
-        return self.client.chat.completions.create(**create_params)
+        return create_params
+
+    def get_chat_completion(
+        self,
+        agent: Agent,
+        history: List,
+        model_override: str,
+        stream: bool,
+        debug: bool,
+        cache: bool = False,
+    ) -> ChatCompletionMessage:
+        create_params = self.build_completion_params(agent, history, model_override, stream, debug)
+        if not cache or self.llm_cache is None:
+            return self.client.chat.completions.create(**create_params)
+
+        key = self.llm_cache.make_key(create_params, agent.tools_key, self.endpoint)
+        message = self.llm_cache.get_message(key)
+        if message is not None:
+            debug_print(debug, "LLM cache hit:", key)
+            if stream:
+                return chunks_from_message(create_params["model"], message)
+            return completion_from_message(create_params["model"], message)
+
+        completion = self.client.chat.completions.create(**create_params)
+        if stream:
+            return self.llm_cache.wrap_stream(key, completion)
+        self.llm_cache.set_message(key, message_from_completion(completion))
+        return completion
+
+    async def aget_chat_completion(
+        self,
+        agent: Agent,
+        history: List,
+        model_override: str,
+        stream: bool,
+        debug: bool,
+        cache: bool = False,
+    ) -> ChatCompletionMessage:
+        create_params = self.build_completion_params(agent, history, model_override, stream, debug)
+        # Streams cannot be shared, only complete responses are deduplicated
+        if stream or self.llm_flights is None:
+            return await self.acreate_chat_completion(create_params, stream, debug, cache, tools_key=agent.tools_key)
+
+        key = LLMCache.make_key(create_params, agent.tools_key, self.endpoint)
+        return await self.llm_flights.do(
+            key, lambda: self.acreate_chat_completion(create_params, stream, debug, cache, key)
+        )
+
+    async def acreate_chat_completion(self, create_params, stream, debug, cache, key=None, tools_key=None):
+        if not cache or self.llm_cache is None:
+            return await self.async_client.chat.completions.create(**create_params)
+
+        if key is None:
+            key = self.llm_cache.make_key(create_params, tools_key, self.endpoint)
+        message = self.llm_cache.get_message(key)
+        if message is not None:
+            debug_print(debug, "LLM cache hit:", key)
+            if stream:
+                return achunks_from_message(create_params["model"], message)
+            return completion_from_message(create_params["model"], message)
+
+        completion = await self.async_client.chat.completions.create(**create_params)
+        if stream:
+            return self.llm_cache.awrap_stream(key, completion)
+        self.llm_cache.set_message(key, message_from_completion(completion))
+        return completion
 
     def handle_function_result(self, result, debug) -> Result:
         match result:
@@ -98,34 +221,51 @@ class Swarm:
         # function_map = {f.__name__: f for f in functions}
         function_map = {f["name"]: f for f in functions}
 
-        partial_response = Response(messages=[], agent=None, context_variables={})
-
+        # Tools are submitted to the pool first and run concurrently, the results keep the order of the calls
+        pending = []
         for tool_call in tool_calls:
             name = tool_call.function.name
+            tool = self.tools.get(name)
             # handle missing tool case, skip to next tool
-            if name not in function_map:
+            if name not in function_map or (tool is None and name != __TRANSFER_TO_AGENT__):
                 debug_print(debug, f"Tool {name} not found in function map.")
-                partial_response.messages.append(
-                    {
-                        "role": "tool",
-                        "tool_call_id": tool_call.id,
-                        "tool_name": name,
-                        "content": f"Error: Tool {name} not found.",
-                    }
-                )
+                pending.append(Result(value=f"Error: Tool {name} not found."))
                 continue
             args = json.loads(tool_call.function.arguments)
             debug_print(debug, f"Processing tool call: {name} with arguments {args}")
 
-            func = function_map[name]
             if name == __TRANSFER_TO_AGENT__ and self.workflow:
-                func = self.workflow.transfer_to_agent
+                # Transfers run nested tool calls, they are not submitted to the pool to avoid exhausting it
+                pending.append((self.workflow.transfer_to_agent, args, None))
             else:
-                func = globals()[func["name"]]
+                key = self.tool_cache_key(tool, args)
+                cached = self.tool_cache.get_result(key) if key is not None else None
+                if cached is not None:
+                    debug_print(debug, f"Tool cache hit: {name}")
+                    pending.append(self.handle_function_result(cached, debug))
+                    continue
+                timeout = tool.timeout or self.tool_timeout
+                deadline = time.monotonic() + timeout if timeout else None
+                future = get_tool_executor().submit(self.call_tool, tool, args, key)
+                pending.append((future, timeout, deadline))
 
-            raw_result = func(**args)
+        partial_response = Response(messages=[], agent=None, context_variables={})
+        for tool_call, item in zip(tool_calls, pending):
+            name = tool_call.function.name
+            if isinstance(item, Result):
+                result = item
+            elif isinstance(item[0], concurrent.futures.Future):
+                future, timeout, deadline = item
+                try:
+                    raw_result = future.result(timeout=None if deadline is None else max(0.0, deadline - time.monotonic()))
+                    result = self.handle_function_result(raw_result, debug)
+                except concurrent.futures.TimeoutError:
+                    debug_print(debug, f"Tool {name} timed out.")
+                    result = Result(value=f"Error: Tool {name} timed out after {timeout} seconds.")
+            else:
+                func, args, _ = item
+                result = self.handle_function_result(func(**args), debug)
 
-            result: Result = self.handle_function_result(raw_result, debug)
             partial_response.messages.append(
                 {
                     "role": "tool",
@@ -140,6 +280,98 @@ class Swarm:
 
         return partial_response
 
+    async def ahandle_tool_calls(
+        self,
+        tool_calls: List[ChatCompletionMessageToolCall],
+        functions: List[dict],
+        context_variables: dict,
+        debug: bool,
+    ) -> Response:
+        function_map = {f["name"]: f for f in functions}
+
+        # The tool calls of one turn run concurrently, the results keep the order of the calls
+        tasks = [asyncio.ensure_future(self.ahandle_tool_call(tool_call, function_map, debug)) for tool_call in tool_calls]
+        try:
+            results = await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        partial_response = Response(messages=[], agent=None, context_variables={})
+        for tool_call, result in zip(tool_calls, results):
+            partial_response.messages.append(
+                {
+                    "role": "tool",
+                    "tool_call_id": tool_call.id,
+                    "tool_name": tool_call.function.name,
+                    "content": result.value,
+                }
+            )
+            partial_response.context_variables.update(result.context_variables)
+            if result.agent:
+                partial_response.agent = result.agent
+
+        return partial_response
+
+    async def ahandle_tool_call(self, tool_call: ChatCompletionMessageToolCall, function_map: dict, debug: bool) -> Result:
+        name = tool_call.function.name
+        tool = self.tools.get(name)
+        # handle missing tool case
+        if name not in function_map or (tool is None and name != __TRANSFER_TO_AGENT__):
+            debug_print(debug, f"Tool {name} not found in function map.")
+            return Result(value=f"Error: Tool {name} not found.")
+        args = json.loads(tool_call.function.arguments)
+        debug_print(debug, f"Processing tool call: {name} with arguments {args}")
+        if self.workflow:
+            await self.workflow.on_tool_call(name, args)
+
+        if name == __TRANSFER_TO_AGENT__ and self.workflow:
+            raw_result = await self.workflow.atransfer_to_agent(**args)
+            return self.handle_function_result(raw_result, debug)
+
+        key = self.tool_cache_key(tool, args)
+        if key is not None:
+            cached = self.tool_cache.get_result(key)
+            if cached is not None:
+                debug_print(debug, f"Tool cache hit: {name}")
+                return self.handle_function_result(cached, debug)
+
+        timeout = tool.timeout or self.tool_timeout
+        try:
+            # Only the results of cacheable tools are shared by identical calls
+            if self.tool_flights is not None and tool.cacheable:
+                flight_key = (name, json.dumps(args, sort_keys=True, ensure_ascii=False))
+                raw_result = await self.tool_flights.do(flight_key, lambda: self.acall_function(tool, args, timeout, key))
+            else:
+                raw_result = await self.acall_function(tool, args, timeout, key)
+        except asyncio.TimeoutError:
+            debug_print(debug, f"Tool {name} timed out.")
+            return Result(value=f"Error: Tool {name} timed out after {timeout} seconds.")
+        return self.handle_function_result(raw_result, debug)
+
+    def tool_cache_key(self, tool, args):
+        """Key of the call in the tool cache, None if its result is not cached"""
+        if self.tool_cache is None or not tool.cacheable or not tool.ttl:
+            return None
+        return ToolCache.make_key(tool.name, args)
+
+    def call_tool(self, tool, args, key=None):
+        result = tool.call(**args)
+        if key is not None:
+            self.tool_cache.set_result(key, result, tool.ttl)
+        return result
+
+    async def acall_function(self, tool, args, timeout=None, key=None):
+        if tool.is_async:
+            result = await asyncio.wait_for(tool.acall(**args), timeout)
+            if key is not None:
+                self.tool_cache.set_result(key, result, tool.ttl)
+            return result
+        # Blocking tools must not stall the event loop, they run in the bounded pool
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(get_tool_executor(), functools.partial(self.call_tool, tool, args, key))
+        return await asyncio.wait_for(future, timeout)
+
     def run_and_stream(
         self,
         agent: Agent,
@@ -149,10 +381,13 @@ class Swarm:
         debug: bool = False,
         max_turns: int = float("inf"),
         execute_tools: bool = True,
+        cache: bool = False,
     ):
         active_agent = agent
-        context_variables = copy.deepcopy(context_variables)
-        history = copy.deepcopy(messages)
+        # Layered scope: the caller's variables are read through, tool results only write the top layer
+        context_variables = ChainMap({}, context_variables)
+        # Messages are never modified once appended, so the history only copies the references
+        history = list(messages)
         init_len = len(messages)
 
         while len(history) - init_len < max_turns:
@@ -178,6 +413,7 @@ class Swarm:
                 model_override=model_override,
                 stream=True,
                 debug=debug,
+                cache=cache,
             )
 
             yield {"delim": "start"}
@@ -240,6 +476,7 @@ class Swarm:
         debug: bool = False,
         max_turns: int = float("inf"),
         execute_tools: bool = True,
+        cache: bool = False,
     ) -> Response:
         if stream:
             return self.run_and_stream(
@@ -250,11 +487,14 @@ class Swarm:
                 debug=debug,
                 max_turns=max_turns,
                 execute_tools=execute_tools,
+                cache=cache,
             )
 
         active_agent = agent
-        context_variables = copy.deepcopy(context_variables)
-        history = copy.deepcopy(messages)
+        # Layered scope: the caller's variables are read through, tool results only write the top layer
+        context_variables = ChainMap({}, context_variables)
+        # Messages are never modified once appended, so the history only copies the references
+        history = list(messages)
         init_len = len(messages)
 
         while len(history) - init_len < max_turns and active_agent:
@@ -266,12 +506,13 @@ class Swarm:
                 model_override=model_override,
                 stream=stream,
                 debug=debug,
+                cache=cache,
             )
             message = completion.choices[0].message
             debug_print(debug, "Received completion:", message)
-            message.sender = active_agent.name
+            # The completion may be shared with other sessions (cache, single-flight), it is annotated on a copy
             history.append(
-                json.loads(message.model_dump_json())
+                dict(json.loads(message.model_dump_json()), sender=active_agent.name)
             )  # to avoid OpenAI types (?)
 
             if not message.tool_calls or not execute_tools:
@@ -292,3 +533,166 @@ class Swarm:
             agent=active_agent,
             context_variables=context_variables,
         )
+
+    async def arun_and_stream(
+        self,
+        agent: Agent,
+        messages: List,
+        context_variables: dict = {},
+        model_override: str = None,
+        debug: bool = False,
+        max_turns: int = float("inf"),
+        execute_tools: bool = True,
+        cache: bool = False,
+    ):
+        active_agent = agent
+        # Layered scope: the caller's variables are read through, tool results only write the top layer
+        context_variables = ChainMap({}, context_variables)
+        # Messages are never modified once appended, so the history only copies the references
+        history = list(messages)
+        init_len = len(messages)
+
+        while len(history) - init_len < max_turns:
+
+            message = {
+                "content": "",
+                "sender": agent.name,
+                "role": "assistant",
+                "function_call": None,
+                "tool_calls": defaultdict(
+                    lambda: {
+                        "function": {"arguments": "", "name": ""},
+                        "id": "",
+                        "type": "",
+                    }
+                ),
+            }
+
+            # get completion with current history, agent
+            completion = await self.aget_chat_completion(
+                agent=active_agent,
+                history=history,
+                model_override=model_override,
+                stream=True,
+                debug=debug,
+                cache=cache,
+            )
+
+            yield {"delim": "start"}
+            async for chunk in completion:
+                delta = json.loads(chunk.choices[0].delta.json())
+                if delta["role"] == "assistant":
+                    delta["sender"] = active_agent.name
+                yield delta
+                delta.pop("role", None)
+                delta.pop("sender", None)
+                merge_chunk(message, delta)
+            yield {"delim": "end"}
+
+            message["tool_calls"] = list(message.get("tool_calls", {}).values())
+            if not message["tool_calls"]:
+                message["tool_calls"] = None
+            debug_print(debug, "Received completion:", message)
+            history.append(message)
+
+            if not message["tool_calls"] or not execute_tools:
+                debug_print(debug, "Ending turn.")
+                break
+
+            # convert tool_calls to objects
+            tool_calls = []
+            for tool_call in message["tool_calls"]:
+                function = Function(
+                    arguments=tool_call["function"]["arguments"],
+                    name=tool_call["function"]["name"],
+                )
+                tool_call_object = ChatCompletionMessageToolCall(
+                    id=tool_call["id"], function=function, type=tool_call["type"]
+                )
+                tool_calls.append(tool_call_object)
+
+            # handle function calls, updating context_variables, and switching agents
+            partial_response = await self.ahandle_tool_calls(
+                tool_calls, active_agent.functions, context_variables, debug
+            )
+            history.extend(partial_response.messages)
+            context_variables.update(partial_response.context_variables)
+            if partial_response.agent:
+                active_agent = partial_response.agent
+
+        yield {
+            "response": Response(
+                messages=history[init_len:],
+                agent=active_agent,
+                context_variables=context_variables,
+            )
+        }
+
+    async def arun(
+        self,
+        agent: Agent,
+        messages: List,
+        context_variables: dict = {},
+        model_override: str = None,
+        stream: bool = False,
+        debug: bool = False,
+        max_turns: int = float("inf"),
+        execute_tools: bool = True,
+        cache: bool = False,
+    ) -> Response:
+        """Same as 'run', using the async client so that no thread is held by in-flight requests"""
+        if stream:
+            return self.arun_and_stream(
+                agent=agent,
+                messages=messages,
+                context_variables=context_variables,
+                model_override=model_override,
+                debug=debug,
+                max_turns=max_turns,
+                execute_tools=execute_tools,
+                cache=cache,
+            )
+
+        active_agent = agent
+        # Layered scope: the caller's variables are read through, tool results only write the top layer
+        context_variables = ChainMap({}, context_variables)
+        # Messages are never modified once appended, so the history only copies the references
+        history = list(messages)
+        init_len = len(messages)
+
+        while len(history) - init_len < max_turns and active_agent:
+
+            # get completion with current history, agent
+            completion = await self.aget_chat_completion(
+                agent=active_agent,
+                history=history,
+                model_override=model_override,
+                stream=stream,
+                debug=debug,
+                cache=cache,
+            )
+            message = completion.choices[0].message
+            debug_print(debug, "Received completion:", message)
+            # The completion may be shared with other sessions (cache, single-flight), it is annotated on a copy
+            history.append(
+                dict(json.loads(message.model_dump_json()), sender=active_agent.name)
+            )  # to avoid OpenAI types (?)
+
+            if not message.tool_calls or not execute_tools:
+                debug_print(debug, "Ending turn.")
+                break
+
+            # handle function calls, updating context_variables, and switching agents
+            partial_response = await self.ahandle_tool_calls(
+                message.tool_calls, active_agent.functions, context_variables, debug
+            )
+            history.extend(partial_response.messages)
+            context_variables.update(partial_response.context_variables)
+            if partial_response.agent:
+                active_agent = partial_response.agent
+
+        return Response(
+            messages=history[init_len:],
+            agent=active_agent,
+            context_variables=context_variables,
+        )
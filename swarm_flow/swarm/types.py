@@ -19,6 +19,9 @@ class Agent(BaseModel):
     functions: List[dict] = []
     tool_choice: Optional[Union[dict[str, Any], str]] = None
     parallel_tool_calls: bool = True
+    # Precomputed 'tools' payload and its hash, built from 'functions' on each request when not set
+    tools: Optional[tuple] = None
+    tools_key: Optional[str] = None
 
 
 class Response(BaseModel):
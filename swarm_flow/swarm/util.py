@@ -1,4 +1,7 @@
+import copy
+import hashlib
 import inspect
+import json
 from datetime import datetime
 
 
@@ -28,6 +31,30 @@ def merge_chunk(final_response: dict, delta: dict) -> None:
         merge_fields(final_response["tool_calls"][index], tool_calls[0])
 
 
+def function_tools(functions: list, hidden_params: tuple=("context_variables",)) -> tuple:
+    """
+    Build the 'tools' payload of the OpenAI API from the function schemas, without modifying them.
+    The payload is shared by all requests of an agent, so it is returned as a tuple which must not be modified.
+    """
+    tools = []
+    for function in functions:
+        function = copy.deepcopy(function)
+        params = function.get("parameters")
+        if params:
+            for name in hidden_params:
+                params.get("properties", {}).pop(name, None)
+            if params.get("required"):
+                params["required"] = [name for name in params["required"] if name not in hidden_params]
+        tools.append({"type": "function", "function": function})
+    return tuple(tools)
+
+
+def tools_key(tools: tuple) -> str:
+    """Stable hash of the tools payload, so that the LLM cache does not serialize the schemas on every request"""
+    data = json.dumps(tools, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
 def function_to_json(func) -> dict:
     """
     Converts a Python function into a JSON-serializable dictionary
@@ -0,0 +1,93 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+import jinja2
+
+
+class TemplateCache:
+    def __init__(self, bytecode_cache_dir: str=None, max_size: int=1024):
+        """
+        Compiled Jinja2 templates keyed by the hash of their source, shared by all executors.
+        :param bytecode_cache_dir: Persist the compiled templates in this directory so cold starts skip compilation.
+        :param max_size: Maximum number of compiled templates kept in memory.
+        """
+        bytecode_cache = None
+        if bytecode_cache_dir:
+            bytecode_cache = jinja2.FileSystemBytecodeCache(bytecode_cache_dir)
+
+        # Templates are loaded by key, which enables the bytecode cache (it is bypassed by 'from_string')
+        self.env = jinja2.Environment(
+            loader=jinja2.FunctionLoader(self.load_source),
+            bytecode_cache=bytecode_cache,
+            cache_size=0,
+            auto_reload=False,
+        )
+
+        self.max_size = max_size
+        self.sources = {}
+        self.templates = OrderedDict()
+        self.lock = threading.Lock()
+
+        # Statistics
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(source: str):
+        return hashlib.sha256(source.encode("utf-8")).hexdigest()
+
+    def load_source(self, key: str):
+        source = self.sources.get(key)
+        if source is None:
+            return None
+        return source, None, lambda: True
+
+    def get(self, source: str):
+        """Get the compiled template, compile it on the first use"""
+        key = self.key(source)
+        with self.lock:
+            template = self.templates.get(key)
+            if template is not None:
+                self.hits += 1
+                self.templates.move_to_end(key)
+                return template
+
+            self.misses += 1
+            self.sources[key] = source
+            try:
+                template = self.env.get_template(key)
+            finally:
+                self.sources.pop(key, None)
+
+            self.templates[key] = template
+            if len(self.templates) > self.max_size:
+                self.templates.popitem(last=False)
+        return template
+
+    def compile(self, sources):
+        """Precompile templates, e.g. all templates of a workflow"""
+        for source in sources:
+            if source is not None:
+                self.get(source)
+
+    def render(self, source: str, variables: dict):
+        if source is None:
+            return None
+        return self.get(source).render(**variables)
+
+    def stats(self):
+        return {"templates": len(self.templates), "hits": self.hits, "misses": self.misses}
+
+
+template_caches = {}
+template_caches_lock = threading.Lock()
+def get_template_cache(bytecode_cache_dir: str=None):
+    """Get the process-wide template cache, one per bytecode cache directory"""
+    key = bytecode_cache_dir or ""
+    with template_caches_lock:
+        template_cache = template_caches.get(key)
+        if template_cache is None:
+            template_cache = TemplateCache(bytecode_cache_dir or None)
+            template_caches[key] = template_cache
+    return template_cache
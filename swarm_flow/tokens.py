@@ -0,0 +1,150 @@
+import json
+import math
+import threading
+from collections import OrderedDict
+
+# Tokens added by the chat format around each message
+__MESSAGE_OVERHEAD__ = 4
+# Tokens primed for the reply of the assistant
+__REPLY_OVERHEAD__ = 3
+# A message is only trimmed if at least this many tokens of it can be kept
+__MIN_TRIMMED_TOKENS__ = 32
+
+# Context windows of known models, matched by the longest prefix of the model name
+__MODEL_CONTEXT_TOKENS__ = {
+    "gpt-5": 400000,
+    "gpt-4.1": 1047576,
+    "gpt-4o": 128000,
+    "gpt-4-turbo": 128000,
+    "gpt-4-0125-preview": 128000,
+    "gpt-4-1106-preview": 128000,
+    "gpt-4-32k": 32768,
+    "gpt-4": 8192,
+    "gpt-3.5-turbo-instruct": 4096,
+    "gpt-3.5-turbo": 16385,
+    "o1-mini": 128000,
+    "o1-preview": 128000,
+    "o1": 200000,
+    "o3": 200000,
+    "o4-mini": 200000,
+}
+
+
+class ContextOverflowError(Exception):
+    """The prompt cannot fit in the context window of the model, retrying the same request fails again"""
+
+
+class Tokenizer:
+    def __init__(self, model: str=None, max_cached: int=8192):
+        """
+        Count the tokens of chat messages, the counts of message contents are cached.
+        tiktoken is used when installed, otherwise the count is estimated from the characters.
+        :param model: Name of the model, unknown models use the 'cl100k_base' encoding.
+        :param max_cached: Maximum number of cached counts.
+        """
+        self.encoding = None
+        try:
+            import tiktoken
+            try:
+                self.encoding = tiktoken.encoding_for_model(model or "")
+            except KeyError:
+                self.encoding = tiktoken.get_encoding("cl100k_base")
+        except ImportError:
+            pass
+
+        self.max_cached = max_cached
+        self.counts = OrderedDict()
+        self.lock = threading.Lock()
+
+    def count(self, text: str):
+        if not text:
+            return 0
+        with self.lock:
+            count = self.counts.get(text)
+            if count is not None:
+                self.counts.move_to_end(text)
+                return count
+
+        if self.encoding is not None:
+            count = len(self.encoding.encode(text, disallowed_special=()))
+        else:
+            # About 4 characters per token for ASCII, 1 token per character otherwise (e.g. CJK)
+            ascii_chars = sum(1 for c in text if ord(c) < 128)
+            count = math.ceil(ascii_chars / 4) + len(text) - ascii_chars
+
+        with self.lock:
+            self.counts[text] = count
+            if len(self.counts) > self.max_cached:
+                self.counts.popitem(last=False)
+        return count
+
+    def count_message(self, message: dict):
+        count = __MESSAGE_OVERHEAD__ + self.count(message.get("content") or "")
+        if message.get("tool_calls"):
+            count += self.count(json.dumps(message["tool_calls"], ensure_ascii=False))
+        return count
+
+    def count_messages(self, messages: list):
+        return sum(self.count_message(message) for message in messages) + __REPLY_OVERHEAD__
+
+    def trim(self, text: str, max_tokens: int):
+        """Keep the last 'max_tokens' tokens of the text"""
+        if max_tokens <= 0:
+            return ""
+        if self.encoding is not None:
+            tokens = self.encoding.encode(text, disallowed_special=())
+            return self.encoding.decode(tokens[-max_tokens:])
+
+        count = self.count(text)
+        if count <= max_tokens:
+            return text
+        return text[-int(len(text) * max_tokens / count):]
+
+
+def fit_messages(tokenizer: Tokenizer, messages: list, budget: int):
+    """
+    Select the most recent messages fitting in 'budget' tokens, in their original order.
+    The oldest selected message is trimmed when only part of it fits, older messages are dropped.
+    """
+    budget -= __REPLY_OVERHEAD__
+    selected = []
+    for message in reversed(messages):
+        count = tokenizer.count_message(message)
+        if count <= budget:
+            selected.append(message)
+            budget -= count
+            continue
+
+        # Trimming tool calls would break the conversation, only the text content is trimmed
+        available = budget - __MESSAGE_OVERHEAD__
+        if message.get("content") and not message.get("tool_calls") and available >= __MIN_TRIMMED_TOKENS__:
+            selected.append(dict(message, content=tokenizer.trim(message["content"], available)))
+        break
+
+    # Tool responses without the assistant message calling them are rejected by the API
+    while selected and selected[-1].get("role") == "tool":
+        selected.pop()
+
+    selected.reverse()
+    return selected
+
+
+def model_context_tokens(model: str):
+    """Context window of the model in tokens, None when the model is unknown"""
+    model = (model or "").split("/")[-1]
+    for prefix in sorted(__MODEL_CONTEXT_TOKENS__, key=len, reverse=True):
+        if model.startswith(prefix):
+            return __MODEL_CONTEXT_TOKENS__[prefix]
+    return None
+
+
+tokenizers = {}
+tokenizers_lock = threading.Lock()
+def get_tokenizer(model: str=None):
+    """Get the process-wide tokenizer of the model"""
+    with tokenizers_lock:
+        tokenizer = tokenizers.get(model)
+        if tokenizer is None:
+            tokenizer = Tokenizer(model)
+            tokenizers[model] = tokenizer
+    return tokenizer
@@ -0,0 +1,61 @@
+import hashlib
+import json
+import re
+import threading
+
+from .cache import MemoryCache, SQLiteCache, TieredCache
+
+
+class ToolCache(TieredCache):
+    """
+    Cache of tool results, keyed by the tool name and its normalized arguments.
+    Each tool sets the time to live of its results (see 'ttl' in registry.py).
+    """
+
+    @staticmethod
+    def normalize(value):
+        # Queries and URLs differing only by whitespace return the same results
+        if isinstance(value, str):
+            return re.sub(r"\s+", " ", value).strip()
+        if isinstance(value, dict):
+            return {k: ToolCache.normalize(v) for k, v in value.items()}
+        if isinstance(value, list):
+            return [ToolCache.normalize(v) for v in value]
+        return value
+
+    @staticmethod
+    def make_key(name: str, args: dict):
+        data = json.dumps([name, ToolCache.normalize(args)], sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+        return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+    def get_result(self, key: str):
+        value = self.get(key)
+        if value is None:
+            return None
+        return json.loads(value)["result"]
+
+    def set_result(self, key: str, result, ttl: float):
+        # Failures are not cached: empty results and results reporting an error
+        if not result or (isinstance(result, dict) and result.get("error")):
+            return
+        try:
+            value = json.dumps({"result": result}, ensure_ascii=False)
+        except TypeError:
+            # Agents and Result objects are not cacheable
+            return
+        self.set(key, value.encode("utf-8"), ttl)
+
+
+tool_caches = {}
+tool_caches_lock = threading.Lock()
+def get_tool_cache(settings: dict):
+    """Get the process-wide tool cache of the settings (see 'cache_settings' in config.py)"""
+    disk_path = settings.get("disk_path") or ""
+    with tool_caches_lock:
+        tool_cache = tool_caches.get(disk_path)
+        if tool_cache is None:
+            memory = MemoryCache(settings.get("memory_max_items", 4096), settings.get("memory_max_bytes", 64 * 1024 * 1024))
+            disk = SQLiteCache(disk_path, settings.get("disk_max_bytes", 1024 * 1024 * 1024)) if disk_path else None
+            tool_cache = ToolCache(memory, disk)
+            tool_caches[disk_path] = tool_cache
+    return tool_cache
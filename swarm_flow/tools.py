@@ -1,13 +1,9 @@
-import pytz
-import requests
 import io
 import contextlib
-from openai import OpenAI
-from duckduckgo_search import DDGS
 from datetime import datetime
-from bs4 import BeautifulSoup
 
-from .rag.rag_simple import RAGSimple
+# The dependencies of the tools are imported on their first use, so that unused tools cost no startup time
+from .clients import get_http_session, get_openai_client, request_timeout
 from .config import llm_settings, rag_settings, tool_settings
 
 rag_clients = {}
@@ -21,6 +17,7 @@ def simple_rag(rag_provider: str, kb_path: str, kb_name: str, query: str) -> str
     :return: Results retrieved from the knowledge base.
     """
     global rag_clients
+    from .rag.rag_simple import RAGSimple
 
     rag_client = rag_clients.get(rag_provider)
     if rag_client is None:
@@ -39,7 +36,7 @@ def describe_image(llm_provider: str, image_link: str, instruction: str) -> str:
     :return: Description of the image.
     """
     llm_params = llm_settings[llm_provider]
-    client = OpenAI(base_url=llm_params["base_url"], api_key=llm_params["api_key"])
+    client = get_openai_client(llm_params["base_url"], llm_params["api_key"])
     response = client.chat.completions.create(
         model=llm_params["default_model"],
         messages=[
@@ -90,6 +87,8 @@ def date(timezone: str="America/New_York") -> str:
     :param timezone: The timezone for which to get the current time (e.g., ’UTC‘, 'America/New_York').
     :return: Formatted current date and time.
     """
+    import pytz
+
     if timezone:
         # Get the current time in the specified timezone
         tz = pytz.timezone(timezone)
@@ -119,6 +118,8 @@ def date_cn(timezone: str="Asia/Shanghai") -> str:
         weekday = weekday_dict[t.weekday()]
         return weekday
 
+    import pytz
+
     if timezone:
         # Get the current time in the specified timezone
         tz = pytz.timezone(timezone)
@@ -135,8 +136,10 @@ def web_content(url: str) -> str:
     :param url: The web page link.
     :return: Text content in the web pages.
     """
+    from bs4 import BeautifulSoup
+
     text = ""
-    response = requests.get(url)
+    response = get_http_session().get(url, timeout=request_timeout())
 
     if response.status_code != 200:
         print(f"Failed to retrieve the content from '{url}', status code: {response.status_code}")
@@ -168,6 +171,8 @@ def web_search_ddg(query: str) -> dict:
     :param query: Input string of the objective.
     :return: Json format data, including search results and error message.
     """
+    from duckduckgo_search import DDGS
+
     proxy = tool_settings.get("web_search_proxy", "")
     if len(proxy.strip()) < 1:
         proxy = None
@@ -200,6 +205,8 @@ def web_search_searxng(query: str, num_results: int=5) -> dict:
     :param num_results: The number of results returned.
     :return: Json format data, including search results and error message.
     """
+    import requests
+
     proxy = None
     web_search_proxy = tool_settings.get("web_search_proxy", "")
     if len(web_search_proxy.strip()) > 0:
@@ -217,7 +224,7 @@ def web_search_searxng(query: str, num_results: int=5) -> dict:
     }
 
     try:
-        response = requests.get(url, params=params, proxies=proxy)
+        response = get_http_session().get(url, params=params, proxies=proxy, timeout=request_timeout())
         response.raise_for_status()
         data = response.json()
 
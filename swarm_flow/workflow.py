@@ -1,13 +1,19 @@
+import copy
 import json
 import re
-import jinja2
-import yaml
+import uuid
 import asyncio
+from datetime import datetime
 
 from .swarm import Swarm
 from .swarm.types import *
-from .config import llm_settings
-from .tools import *
+from .plan import WorkflowPlan
+from .scheduler import StepScheduler
+from .tokens import ContextOverflowError, fit_messages
+from .history import HistoryIndex, get_embedder
+from .streaming import StreamChannel
+from .checkpoint import ContextTracker, apply_changes
+from .events import EventStream, StepStarted, StepFinished, ToolCall, AgentTransfer, FinalOutput
 
 
 class StepTask:
@@ -17,11 +23,11 @@ class StepTask:
         self.prerequisite = step.get("prerequisite", [])
         self.execution = step.get("execution", "sync")
 
+        # Outputs of the completed 'for_each' items, reused when the step is retried
+        self.item_outputs = {}
+
     def render_template(self, template_string, variables):
-        if template_string is None:
-            return None
-        template = self.workflow.jinja_env.from_string(template_string)
-        return template.render(**variables)
+        return self.workflow.template_cache.render(template_string, variables)
 
     async def run(self):
         step = self.step
@@ -37,6 +43,11 @@ class StepTask:
         agent = self.workflow.agents[agent_name]
         agent_params = self.workflow.agent_params[agent_name]
 
+        # Use the LLM response cache, the step setting takes precedence over the agent and workflow settings
+        cache = step.get("cache", agent_params.get("cache", self.workflow.plan.cache))
+
+        await self.workflow.emit_event(StepStarted(step=step_name, agent=agent_name))
+
         # The output variables
         output_var = step["output"]["name"]
         output_type = step["output"].get("type", "string")
@@ -51,15 +62,15 @@ class StepTask:
                 raise Exception(f"Type error, '{for_each['list']}' is not a list and cannot be traversed by ‘for_each’.")
 
             execution_mode = for_each.get("execution", "sync")
+            item_policy = self.workflow.plan.item_retry_policies[step_name]
+            item_outputs = self.item_outputs
 
-            context_variables[output_var] = []
-
-            async def process_item(item):
+            async def process_item(item_index, item):
                 local_context = context_variables.copy()
                 local_context[loop_item] = item
                 local_output_var = for_each.get("output")
                 instructions = self.render_template(agent.instructions, local_context)
-                output = await self.workflow.completion(agent, instructions)
+                output = await self.workflow.completion(agent, instructions, step_name, item_index, cache)
                 # Process 'stop_character' (ignore the content after stop_character)
                 stop_character = step.get("stop_character")
                 if stop_character:
@@ -70,22 +81,42 @@ class StepTask:
                 output_format = for_each.get("format")
                 if output_format:
                     output = self.render_template(output_format, local_context)
-                context_variables[output_var].append(output)
+                item_outputs[item_index] = output
+                self.workflow.checkpoint("item", step=step_name, index=item_index, output=output)
                 return output
 
+            async def retry_process_item(item_index, item):
+                if item_index in item_outputs:
+                    # Completed by a previous attempt of the step
+                    return item_outputs[item_index]
+                on_retry = self.workflow.retry_callback(f"'{step_name}' item {item_index}")
+                return await item_policy.run(lambda: process_item(item_index, item), on_retry)
+
             if execution_mode == "async":
                 # Concurrent execution
-                async def limited_process_item(item, semaphore):
+                async def limited_process_item(item_index, item, semaphore):
                     async with semaphore:
-                        return await process_item(item)
-
-                tasks = [asyncio.create_task(limited_process_item(item, self.workflow.semaphore)) for item in loop_list]
-                await asyncio.gather(*tasks)
+                        return await retry_process_item(item_index, item)
+
+                tasks = [
+                    asyncio.create_task(limited_process_item(item_index, item, self.workflow.semaphore))
+                    for item_index, item in enumerate(loop_list)
+                ]
+                try:
+                    await asyncio.gather(*tasks)
+                except BaseException:
+                    # The completed items are kept, the others are executed again on retry
+                    for task in tasks:
+                        task.cancel()
+                    await asyncio.gather(*tasks, return_exceptions=True)
+                    raise
             else:
                 # Sequential execution
-                for item in loop_list:
-                    await process_item(item)
+                for item_index, item in enumerate(loop_list):
+                    await retry_process_item(item_index, item)
 
+            # Outputs keep the order of the list
+            context_variables[output_var] = [item_outputs[i] for i in range(len(loop_list))]
             output = "\n\n".join(context_variables[output_var])
             if output_type == "string":
                 context_variables[output_var] = output
@@ -95,7 +126,7 @@ class StepTask:
 
         else:
             instructions = self.render_template(agent.instructions, context_variables)
-            output = await self.workflow.completion(agent, instructions)
+            output = await self.workflow.completion(agent, instructions, step_name, cache=cache)
 
             # Process 'stop_character' (ignore the content after stop_character)
             stop_character = step.get("stop_character")
@@ -151,14 +182,23 @@ class StepTask:
                 context_variables[var_name].append(output)
 
         self.workflow.log(f"'{step_name}' has been completed.")
+        await self.workflow.emit_event(StepFinished(step=step_name, output=context_variables.get(output_var)))
 
-        # Mark step completed
-        self.workflow.step_events[step_name].set()
+        # Mark step completed and release the dependent steps
+        self.workflow.checkpoint("step", step=step_name)
+        self.workflow.scheduler.release(step_name)
 
 
 class WorkflowExecutor:
-    def __init__(self, yaml_content, max_concurrency=5, messages=None, context_variables=None,
-                 stream=False, debug=False, status_callback=None, stream_callback=None):
+    def __init__(self, yaml_content=None, max_concurrency=5, messages=None, context_variables=None,
+                 stream=False, debug=False, status_callback=None, stream_callback=None, template_cache=None, plan=None,
+                 checkpoint_store=None, run_id=None, tools=None):
+        """
+        A session running a compiled workflow plan, with its own context variables and history.
+        Sessions are cheap, the plan is compiled once per YAML and shared.
+        With a CheckpointStore, the session is checkpointed under 'run_id' after each step and 'for_each' item.
+        Tools are resolved by 'tools' (a ToolRegistry), the process-wide registry by default (see 'register_tool()').
+        """
 
         # Stream output
         self.stream = stream
@@ -170,55 +210,43 @@ class WorkflowExecutor:
         self.status_callback = status_callback
         self.stream_callback = stream_callback
 
-        # Initialize Jinja2 environment
-        self.jinja_env = jinja2.Environment()
-
-        # Parse YAML content
-        self.workflow = yaml.safe_load(yaml_content)
+        # Compiled workflow, cyclic dependencies are rejected here
+        if plan is None:
+            try:
+                plan = WorkflowPlan.from_yaml(yaml_content, template_cache)
+            except Exception as e:
+                self.set_status(f"{e}", type="error")
+                raise
+        self.plan = plan
+
+        self.template_cache = plan.template_cache
+        self.jinja_env = plan.template_cache.env
+        self.workflow = plan.workflow
+        self.llm_settings = plan.llm_settings
+        self.agents = plan.agents
+        self.agent_params = plan.agent_params
+        self.steps = plan.steps
+        self.steps_dict = plan.steps_dict
+        self.step_graph = plan.step_graph
         self.user_input = ""
 
-        # Extract LLM settings
-        llm_provider = self.workflow["workflow"]["llm_provider"]
-        self.llm_settings = llm_settings[llm_provider]
-
-        # Create Swarm client
-        self.client = Swarm(base_url=self.llm_settings["base_url"], api_key=self.llm_settings["api_key"], workflow=self)
+        # Create Swarm client, sharing the LLM clients of the plan
+        self.client = Swarm(
+            client=plan.llm_client, async_client=plan.llm_async_client, workflow=self, llm_cache=plan.llm_cache,
+            llm_flights=plan.llm_flights, tool_flights=plan.tool_flights, tools=tools, tool_cache=plan.tool_cache,
+            endpoint=plan.llm_endpoint
+        )
 
-        # Maximum concurrent requests
+        # Maximum concurrent requests, the semaphore is bound to the event loop of the current execution
         self.max_concurrency = max_concurrency
-        self.semaphore = asyncio.Semaphore(self.max_concurrency)
-
-        # Create the agents dictionary for use in subsequent steps
-        self.agents = {}
-        self.agent_params = {}
-        for a in self.workflow["agents"]:
-            functions = []
-            for func_name in a["functions"]:
-                func = self.get_function_from_name(func_name)
-                if func is None:
-                    continue
-                functions.append(func)
-
-            # Create agent
-            agent = Agent(
-                name=a["name"],
-                description=a["description"],
-                model=a.get("model") or self.llm_settings["default_model"],
-                instructions=a["instruction"],
-                functions=functions,
-                tool_choice=a.get("tool_choice")
-            )
-
-            # Save agent for referencing in workflow
-            self.agents[a["name"]] = agent
-            self.agent_params[a["name"]] = a
+        self.semaphore = None
 
         # Initialize the context used to pass variables between steps
         self.context_variables = {} if context_variables is None else context_variables
 
-        # Set global variables
+        # Set global variables, copied so that sessions never share mutable values
         if self.workflow.get("global_variables"):
-            self.context_variables.update(self.workflow["global_variables"])
+            self.context_variables.update(copy.deepcopy(self.workflow["global_variables"]))
 
         # The final output of the workflow
         self.output = ""
@@ -226,18 +254,36 @@ class WorkflowExecutor:
         # Initialize historical dialogue
         self.messages = [] if messages is None else messages
 
-        # Sort the steps according to the 'order' field
-        self.steps = sorted(self.workflow["steps"], key=lambda x: x["order"])
-
-        # Build a dictionary for steps to access by name
-        self.steps_dict = {step["name"]: step for step in self.steps}
-
         # Create tasks for all steps
         self.step_tasks = {step["name"]: StepTask(step, self) for step in self.steps}
 
-        # Create event and task mapping for step
-        self.step_events = {step["name"]: asyncio.Event() for step in self.steps}
-        self.step_futures = {}
+        # Scheduler of the current execution and the steps it has completed
+        self.scheduler = None
+        self.completed_steps = set()
+
+        # Channel of the streamed chunks of the current execution
+        self.stream_channel = None
+
+        # Events of the current execution, only consumed through 'astream()'
+        self.event_stream = None
+
+        # Durable checkpoints, the first checkpoint of the run id holds a full snapshot, then only the changes
+        self.checkpoint_store = checkpoint_store
+        self.run_id = run_id or (uuid.uuid4().hex if checkpoint_store is not None else None)
+        self.context_tracker = None
+
+        # Compaction: 'self.messages' keeps the full log, requests send the summary of its first 'summarized_count' messages
+        self.summary = ""
+        self.summarized_count = 0
+        self.compaction_task = None
+
+        # Embeddings of the history, when the history is selected by relevance
+        self.history_index = None
+        if self.plan.history_retrieval:
+            retrieval = self.plan.history_retrieval
+            self.history_index = HistoryIndex(
+                lambda texts: get_embedder(retrieval["rag_provider"]).encode(texts), retrieval["max_chars"]
+            )
 
     def extract_list(self, text):
         res = None
@@ -292,23 +338,77 @@ class WorkflowExecutor:
             message = f'{status}:\n```\n{details.strip("```")}\n```'
         self.status_callback(message, type)
 
-    def build_messages(self, instructions, history_length=100):
+    def build_messages(self, instructions, history_length=100, agent_name=None, history=None):
+        """
+        Build the messages of a request: the instructions, then the most recent history fitting in the token budget.
+        The budget is 'max_context_tokens' of the agent, minus the instructions, tool schemas and 'max_new_tokens'.
+        ContextOverflowError is only raised when 'max_context_tokens' is set on the agent or in the workflow.
+        :param history: Messages selected by 'select_history()', the last 'history_length' messages by default.
+        """
         if history_length is None:
             history_length = 100
 
         messages = []
         if len(instructions) > 0:
             messages.append({"role": "system", "content": instructions})
-        if history_length > 0:
-            for item in self.messages[-history_length:]:
-                messages.append(item)
-        return messages
+        if history_length <= 0:
+            return messages
+
+        if history is None:
+            history = self.messages[self.summarized_count:][-history_length:]
+        if self.summary:
+            history = [{"role": "system", "content": f"Summary of the earlier conversation:\n{self.summary}"}] + history
+        budget = self.plan.agent_budgets.get(agent_name)
+        if budget is None or not budget["max_context_tokens"]:
+            return messages + history
+
+        tokenizer = budget["tokenizer"]
+        available = (budget["max_context_tokens"] - budget["max_new_tokens"] - budget["tool_tokens"]
+                     - tokenizer.count_messages(messages))
+        if available < 0:
+            if budget["strict"]:
+                raise ContextOverflowError(
+                    f"The instructions of '{agent_name}' exceed the context window by {-available} tokens."
+                )
+            # The default budget may be below the real context window, the request is left to the model
+            self.log(f"History of '{agent_name}'", f"The instructions exceed the default budget by {-available} tokens")
+            return messages
+        selected = fit_messages(tokenizer, history, available)
+        if len(selected) < len(history) or (selected and selected[0] is not history[-len(selected)]):
+            self.log(f"History of '{agent_name}'", f"{len(selected)}/{len(history)} messages fit in {available} tokens")
+        return messages + selected
+
+    async def select_history(self, instructions, history_length=100, agent_name=None):
+        """
+        Select the earlier messages most relevant to the instructions and the most recent ones.
+        Returns None when the history is not selected by relevance, or when it is short enough to be sent whole.
+        When the embeddings cannot be computed, the last messages are selected.
+        """
+        retrieval = self.plan.history_retrieval
+        if self.history_index is None or self.agent_params[agent_name].get("history_retrieval", True) is False:
+            return None
+        if history_length is None:
+            history_length = 100
+        history_length = min(history_length, retrieval["top_k"] + retrieval["recent"])
+        if history_length <= 0 or len(self.messages) - self.summarized_count <= history_length:
+            return None
+
+        # Embedding requests are blocking
+        messages = list(self.messages)
+        try:
+            indices = await asyncio.to_thread(
+                self.history_index.search, messages, instructions,
+                history_length - min(retrieval["recent"], history_length), min(retrieval["recent"], history_length),
+                self.summarized_count
+            )
+        except Exception as e:
+            # The request is still sent, with the most recent messages only
+            self.log(f"History retrieval of '{agent_name}' caused an exception", f"{e}")
+            return messages[self.summarized_count:][-history_length:]
+        return [messages[i] for i in indices]
 
     def get_function_from_name(self, func_name):
-        for func in self.workflow.get("functions", []):
-            if func["name"] == func_name:
-                return func
-        return None
+        return self.plan.get_function_from_name(func_name)
 
     def transfer_to_agent(self, agent_name, query):
         self.log(f"TRANSFER -> {agent_name}", query)
@@ -318,9 +418,33 @@ class WorkflowExecutor:
         if agent is None:
             return None
         agent_params = self.agent_params[agent_name]
-        messages = self.build_messages(query, agent_params.get("history_length"))
+        messages = self.build_messages(query, agent_params.get("history_length"), agent_name)
         return self.client.run(agent, messages, context_variables=self.context_variables, stream=False, debug=self.debug)
 
+    async def atransfer_to_agent(self, agent_name, query):
+        self.log(f"TRANSFER -> {agent_name}", query)
+        self.context_variables["transfer_to"] = {"status": f"Transfer to '{agent_name}'", "details": query}
+        await self.emit_event(AgentTransfer(agent=agent_name, query=query))
+
+        agent = self.agents.get(agent_name)
+        if agent is None:
+            return None
+        agent_params = self.agent_params[agent_name]
+        history = await self.select_history(query, agent_params.get("history_length"), agent_name)
+        messages = self.build_messages(query, agent_params.get("history_length"), agent_name, history)
+        return await self.client.arun(agent, messages, context_variables=self.context_variables, stream=False, debug=self.debug)
+
+    async def on_tool_call(self, name, arguments):
+        await self.emit_event(ToolCall(name=name, arguments=arguments))
+
+    async def emit_event(self, event):
+        if self.event_stream is not None:
+            await self.event_stream.put(event)
+
+    def on_stream_error(self, error):
+        self.log("Stream callback caused an exception", f"{error}")
+        self.set_status("Stream callback caused an exception", f"{error}", type="warning")
+
     def default_stream_callback(self, chunk):
         if "content" in chunk and chunk["content"] is not None:
             print(chunk["content"], end="", flush=True)
@@ -328,28 +452,45 @@ class WorkflowExecutor:
         if "delim" in chunk and chunk["delim"] == "end":
             print()  # End of response message
 
-    def process_streaming_response(self, response):
-        for chunk in response:
-            if self.stream_callback and callable(self.stream_callback):
-                self.stream_callback(chunk)
-            else:
-                self.default_stream_callback(chunk)
+    def dispatch_stream_chunk(self, chunk):
+        if self.stream_callback and callable(self.stream_callback):
+            self.stream_callback(chunk)
+        else:
+            self.default_stream_callback(chunk)
+
+    async def process_streaming_response(self, response, step_name=None, item_index=None, agent_name=None):
+        async for chunk in response:
+            # Tag a copy of the chunk (the delta is still merged by Swarm), chunks of concurrent steps share the channel
+            tagged_chunk = dict(chunk, step=step_name, item_index=item_index, agent=agent_name)
+            if self.event_stream is None or callable(self.stream_callback):
+                if self.stream_channel is not None:
+                    await self.stream_channel.send(tagged_chunk)
+                else:
+                    self.dispatch_stream_chunk(tagged_chunk)
+
+            if self.event_stream is not None:
+                if chunk.get("content"):
+                    await self.event_stream.put_delta(step_name, item_index, agent_name, chunk["content"])
+                elif chunk.get("delim") == "end":
+                    await self.event_stream.flush((step_name, item_index))
+
             if "response" in chunk:
                 return chunk["response"]
 
-    async def completion(self, agent, instructions):
+    async def completion(self, agent, instructions, step_name=None, item_index=None, cache=False):
         self.log("instruction", instructions)
 
         agent_params = self.agent_params[agent.name]
-        messages = self.build_messages(instructions, agent_params.get("history_length"))
+        history = await self.select_history(instructions, agent_params.get("history_length"), agent.name)
+        messages = self.build_messages(instructions, agent_params.get("history_length"), agent.name, history)
         context_variables = self.context_variables
         model_override = None
-        response = await asyncio.to_thread(
-            self.client.run, agent, messages, context_variables, model_override, self.stream, self.debug
+        response = await self.client.arun(
+            agent, messages, context_variables, model_override, self.stream, self.debug, cache=cache
         )
 
         if self.stream:
-            response = self.process_streaming_response(response)
+            response = await self.process_streaming_response(response, step_name, item_index, agent.name)
 
         self.output = response.messages[-1]["content"].strip()
         self.log("output", f"{self.output}")
@@ -361,56 +502,44 @@ class WorkflowExecutor:
 
         return self.output
 
+    def retry_callback(self, name):
+        def on_retry(attempt, error, delay):
+            self.log(f"{name} caused an exception, retry in {delay:.1f}s (attempt {attempt + 1})", f"{error}")
+            self.set_status(f"{name} caused an exception, retry (attempt {attempt + 1}) ...", f"{error}", type="warning")
+        return on_retry
+
     async def execute_step(self, step_name):
         step_task = self.step_tasks[step_name]
-        # Waiting for the pre-steps to complete
-        for dep in step_task.prerequisite:
-            await self.step_events[dep].wait()
-
+        policy = self.plan.step_retry_policies[step_name]
+        on_retry = self.retry_callback(f"'{step_name}'")
         if step_task.execution == "async":
             # Asynchronous execution
             async with self.semaphore:
-                await step_task.run()
+                await policy.run(step_task.run, on_retry)
         else:
             # Synchronize execution
-            await step_task.run()
+            await policy.run(step_task.run, on_retry)
 
     async def execute_workflow(self):
-        pending_steps = set(step["name"] for step in self.steps)
-        while pending_steps:
-            scheduled_in_this_round = False
-            for step in self.steps:
-                step_name = step["name"]
-                if step_name not in pending_steps:
-                    continue
-                step_task = self.step_tasks[step_name]
-                prerequisite = step_task.prerequisite
-                if all(self.step_events[pre].is_set() for pre in prerequisite):
-                    # Pre-step completed
-                    pending_steps.remove(step_name)
-                    scheduled_in_this_round = True
-                    if step_task.execution == "async":
-                        # Asynchronous execution
-                        task = asyncio.create_task(self.execute_step(step_name))
-                        self.step_futures[step_name] = task
-                    else:
-                        # Synchronize execution
-                        await self.execute_step(step_name)
-            if not scheduled_in_this_round:
-                # Check if there are any running tasks
-                if any(not task.done() for task in self.step_futures.values()):
-                    # Waiting for task completion
-                    await asyncio.sleep(0.1)
-                else:
-                    # Unable to schedule new step and there are no running tasks, there may be a cyclic dependency
-                    self.set_status(f"Unable to execute workflow, there may be a circular dependency.", type="error")
-                    raise Exception("Unable to execute workflow, there may be a circular dependency.")
-            else:
-                # Give up control and execute the scheduled task
-                await asyncio.sleep(0)
-        # Waiting for all asynchronous tasks to complete
-        if self.step_futures:
-            await asyncio.gather(*self.step_futures.values())
+        # Steps are released by their prerequisites as soon as they are completed,
+        # the steps completed by a previous attempt are skipped
+        self.scheduler = StepScheduler(self.step_graph, self.execute_step, self.completed_steps)
+        await self.scheduler.run()
+
+    def checkpoint(self, kind, status=None, **data):
+        if self.checkpoint_store is None:
+            return
+
+        if self.context_tracker is None:
+            # The first checkpoint of the run id
+            self.checkpoint_store.create_run(self.run_id, self.plan.workflow_hash)
+            self.checkpoint_store.append(self.run_id, "snapshot", {"context": self.context_variables, "messages": self.messages})
+            self.context_tracker = ContextTracker(self.context_variables, self.messages)
+
+        # Only the changed variables and the new messages are written
+        ops, messages = self.context_tracker.changes()
+        data.update(ops=ops, messages=messages)
+        self.checkpoint_store.append(self.run_id, kind, data, status)
 
     async def run(self, user_input="", max_retry=3):
         self.user_input = user_input.strip()
@@ -419,20 +548,204 @@ class WorkflowExecutor:
         if len(self.user_input) > 0:
             self.messages.append({"role": "user", "content": self.user_input})
 
-        retry = 0
-        while retry < max_retry:
-            retry += 1
-            try:
-                self.output = ""
-                await self.execute_workflow()
-                self.messages.append({"role": "assistant", "content": self.output})
-                break
-            except Exception as e:
-                self.output = ""
-                self.log("WorkflowExecutor.run() caused an exception", f"{e}")
-                self.log(f"retry ({retry}/{max_retry}) ...")
-                self.set_status(f"WorkflowExecutor.run() caused an exception, retry ({retry}/{max_retry}) ...", f"{e}", type="error")
+        # A new run starts from the first step, retries resume from the failed steps
+        self.output = ""
+        self.completed_steps = set()
+        for step_task in self.step_tasks.values():
+            step_task.item_outputs = {}
+
+        self.checkpoint("run_started", status="running", user_input=user_input)
+        return await self.execute_run(max_retry)
+
+    async def resume(self, run_id=None, max_retry=3):
+        """
+        Restore the session checkpointed under 'run_id' and finish its last run if it was interrupted.
+        The completed steps and 'for_each' items are skipped.
+        """
+        if self.checkpoint_store is None:
+            raise Exception("Unable to resume, the executor has no checkpoint store.")
+        run_id = run_id or self.run_id
+        info, records = self.checkpoint_store.load(run_id)
+        if info is None:
+            raise Exception(f"Unable to resume, checkpoint '{run_id}' not found.")
+        if info["workflow_hash"] != self.plan.workflow_hash:
+            self.set_status(f"The workflow of checkpoint '{run_id}' has changed.", type="warning")
+
+        context_variables = {}
+        messages = []
+        completed_steps = set()
+        item_outputs = {}
+        interrupted = False
+        user_input = ""
+        output = ""
+        for kind, data in records:
+            if kind == "snapshot":
+                context_variables = data["context"]
+                messages = data["messages"]
+                continue
+            apply_changes(context_variables, messages, data.get("ops", []), data.get("messages", []))
+            if kind == "run_started":
+                interrupted = True
+                completed_steps = set()
+                item_outputs = {}
+                user_input = data["user_input"]
+            elif kind == "step":
+                completed_steps.add(data["step"])
+                item_outputs.pop(data["step"], None)
+            elif kind == "item":
+                item_outputs.setdefault(data["step"], {})[data["index"]] = data["output"]
+            elif kind == "run_finished":
+                interrupted = False
+                output = data["output"]
+
+        # Restore in place, callers may hold references to the context and messages
+        self.context_variables.clear()
+        self.context_variables.update(context_variables)
+        self.messages[:] = messages
+        if self.compaction_task is not None and not self.compaction_task.done():
+            self.compaction_task.cancel()
+        self.summary = ""
+        self.summarized_count = 0
+        if self.history_index is not None:
+            self.history_index.reset()
+        self.run_id = run_id
+        self.context_tracker = ContextTracker(self.context_variables, self.messages)
+
+        if not interrupted:
+            self.output = output
+            return self.output
+
+        self.log(f"Resume '{run_id}'", f"completed steps: {sorted(completed_steps)}")
+        self.user_input = user_input.strip()
+        self.output = ""
+        self.completed_steps = completed_steps & set(self.step_tasks)
+        for step_name, step_task in self.step_tasks.items():
+            step_task.item_outputs = dict(item_outputs.get(step_name, {}))
+        return await self.execute_run(max_retry)
+
+    async def execute_run(self, max_retry=3):
+        # Asyncio primitives are created for each execution, callers may run the session on a new event loop each time
+        self.semaphore = asyncio.Semaphore(self.max_concurrency)
 
+        # A compaction cancelled with the event loop of the previous run starts again, the run never waits for it
+        self.schedule_compaction()
+
+        # All streamed chunks of this run go through one channel
+        self.stream_channel = StreamChannel(self.dispatch_stream_chunk, self.on_stream_error)
+        completed = False
+        try:
+            retry = 0
+            while retry < max_retry:
+                retry += 1
+                try:
+                    await self.execute_workflow()
+                    self.messages.append({"role": "assistant", "content": self.output})
+                    completed = True
+                    break
+                except Exception as e:
+                    self.log("WorkflowExecutor.run() caused an exception", f"{e}")
+                    if not self.plan.retry_policy.is_retryable(e):
+                        self.output = ""
+                        self.set_status(f"WorkflowExecutor.run() caused an exception", f"{e}", type="error")
+                        break
+                    if retry >= max_retry:
+                        self.output = ""
+                    self.log(f"retry ({retry}/{max_retry}) ...")
+                    self.set_status(f"WorkflowExecutor.run() caused an exception, retry ({retry}/{max_retry}) ...", f"{e}", type="error")
+        finally:
+            await self.stream_channel.aclose()
+            self.stream_channel = None
+
+        if completed:
+            self.checkpoint("run_finished", status="completed", output=self.output)
+            self.schedule_compaction()
+        else:
+            self.checkpoint("run_failed", status="failed")
+
+        self.log("LLM cache", json.dumps(self.plan.llm_cache.stats()))
+        if self.plan.tool_cache is not None:
+            self.log("Tool cache", json.dumps(self.plan.tool_cache.stats()))
+        if self.plan.llm_flights is not None:
+            self.log("LLM single-flight", json.dumps(self.plan.llm_flights.stats()))
+        if self.plan.tool_flights is not None:
+            self.log("Tool single-flight", json.dumps(self.plan.tool_flights.stats()))
         self.set_status("All steps have been completed.")
 
         return self.output
+
+    def schedule_compaction(self):
+        """
+        Summarize the older turns in a background task once the history passes the threshold.
+        Requests never wait for it, they send the previous summary until the compaction is finished.
+        """
+        compaction = self.plan.compaction
+        if not compaction:
+            return
+        task = self.compaction_task
+        if task is not None and not task.done() and task.get_loop() is asyncio.get_running_loop():
+            return
+        end = len(self.messages) - compaction["keep"]
+        if len(self.messages) - self.summarized_count < compaction["threshold"] or end <= self.summarized_count:
+            return
+        self.compaction_task = asyncio.create_task(self.compact(end))
+
+    async def compact(self, end):
+        """Merge the messages from 'summarized_count' to 'end' into the summary"""
+        start = self.summarized_count
+        messages = self.messages[start:end]
+        transcript = "\n\n".join(f'{m["role"]}: {m["content"]}' for m in messages if m.get("content"))
+        query = f"Previous summary:\n{self.summary or '(empty)'}\n\nNew messages:\n{transcript}"
+
+        agent = self.plan.compaction_agent
+        try:
+            response = await self.client.arun(
+                agent, [{"role": "system", "content": agent.instructions}, {"role": "user", "content": query}],
+                stream=False, debug=self.debug
+            )
+        except Exception as e:
+            self.log("Compaction caused an exception", f"{e}")
+            return
+
+        # The history may have been replaced meanwhile (e.g. resume)
+        if self.summarized_count != start or len(self.messages) < end:
+            return
+        self.summary = response.messages[-1]["content"].strip()
+        self.summarized_count = end
+        self.log("Compaction", f"{end} messages summarized")
+
+    async def astream(self, user_input="", max_retry=3, max_buffered_events=256, coalesce_chars=32):
+        """
+        Run the workflow and yield its events: StepStarted, StepFinished, TokenDelta, ToolCall, AgentTransfer and FinalOutput.
+        The events are buffered up to 'max_buffered_events', then the workflow waits for the consumer.
+        Token deltas are coalesced into chunks of at least 'coalesce_chars' characters.
+        """
+        event_stream = EventStream(max_buffered_events, coalesce_chars)
+
+        async def produce():
+            cancelled = False
+            try:
+                output = await self.run(user_input, max_retry)
+                await event_stream.put(FinalOutput(output=output))
+            except asyncio.CancelledError:
+                # The consumer has gone away, nobody is waiting for the end of the stream
+                cancelled = True
+                raise
+            finally:
+                if not cancelled:
+                    await event_stream.close()
+
+        # Token deltas are only produced by streamed completions
+        stream = self.stream
+        self.stream = True
+        self.event_stream = event_stream
+        producer = asyncio.create_task(produce())
+        try:
+            async for event in event_stream:
+                yield event
+            await producer
+        finally:
+            if not producer.done():
+                producer.cancel()
+                await asyncio.gather(producer, return_exceptions=True)
+            self.event_stream = None
+            self.stream = stream
@@ -0,0 +1,88 @@
+import asyncio
+import os
+import sys
+import unittest
+from types import SimpleNamespace
+
+from openai.types.chat import ChatCompletion
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from swarm_flow.plan import WorkflowPlan
+from swarm_flow.workflow import WorkflowExecutor
+
+WORKFLOW = """
+workflow:
+  name: "Questions"
+  description: "Answer the questions about the input concurrently"
+  llm_provider: "openai"
+
+agents:
+  - name: "Questioner"
+    description: "Lists questions"
+    instruction: "List questions about: {{ user_input }}"
+    functions: []
+  - name: "Answerer"
+    description: "Answers a question"
+    instruction: "Answer: {{ question }}"
+    functions: []
+
+steps:
+  - name: "Questions"
+    description: "List the questions"
+    order: 1
+    agent: "Questioner"
+    execution: sync
+    output:
+      name: question_list
+      type: list
+    prerequisite: []
+  - name: "Answers"
+    description: "Answer each question"
+    order: 2
+    agent: "Answerer"
+    execution: sync
+    for_each:
+      list: question_list
+      item: question
+      execution: async
+    output:
+      name: answers
+      type: string
+    prerequisite: []
+"""
+
+
+class FakeCompletions:
+    def __init__(self):
+        self.calls = 0
+
+    async def create(self, **kwargs):
+        self.calls += 1
+        # Concurrent items hold the semaphore while waiting
+        await asyncio.sleep(0.01)
+        instructions = kwargs["messages"][0]["content"]
+        content = "1. A?\n2. B?\n3. C?" if instructions.startswith("List") else f"Answer to {instructions[8:]}"
+        return ChatCompletion.model_validate({
+            "id": "test", "object": "chat.completion", "created": 0, "model": kwargs["model"],
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+        })
+
+
+class TestWorkflowExecutor(unittest.TestCase):
+    def test_session_reused_across_event_loops(self):
+        plan = WorkflowPlan(WORKFLOW)
+        completions = FakeCompletions()
+        plan.llm_async_client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+        executor = WorkflowExecutor(plan=plan, max_concurrency=1)
+
+        # Each message runs on a new event loop, like simple_ui.py
+        for turn in range(2):
+            output = asyncio.run(executor.run(f"turn {turn}", max_retry=1))
+            self.assertIn("Answer to C?", output)
+        self.assertEqual(completions.calls, 8)
+        self.assertEqual(len(executor.messages), 4)
+
+
+if __name__ == "__main__":
+    unittest.main()